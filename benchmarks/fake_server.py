@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from pyflaarum import statements
+
+
+# A stand-in for a flaarum server, good enough to measure the client. It keeps
+# projects, table structures and rows in memory and understands the search
+# statement parts the client sends ('=', '!=', '<', '>', 'in' wheres,
+# start_index and limit). Every reply is delayed by 'latency' seconds.
+
+
+def _matches(row: dict, where_objs) -> bool:
+  result = None
+  for where_obj in where_objs:
+    value = row.get(where_obj.field_name)
+    value = "" if value is None else str(value)
+    if where_obj.relation == "in":
+      ok = value in where_obj.field_values
+    elif where_obj.relation == "nin":
+      ok = value not in where_obj.field_values
+    elif where_obj.relation in ("<", ">", "<=", ">="):
+      try:
+        left, right = float(value), float(where_obj.field_value)
+      except ValueError:
+        left, right = value, where_obj.field_value
+      ok = {"<": left < right, ">": left > right, "<=": left <= right, ">=": left >= right}[where_obj.relation]
+    elif where_obj.relation == "!=":
+      ok = value != where_obj.field_value
+    else:
+      ok = value == where_obj.field_value
+
+    if result is None:
+      result = ok
+    elif where_obj.joiner == "or":
+      result = result or ok
+    else:
+      result = result and ok
+
+  return True if result is None else result
+
+
+class _Table:
+  def __init__(self):
+    self.versions = []
+    self.rows = {}
+    self.next_id = 1
+
+
+class FakeFlaarum:
+  def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+    self.latency = latency
+    self.projects = {"first_proj"}
+    self.tables = {}
+    self.requests = {}
+    self.lock = threading.Lock()
+    self._certdir = tempfile.mkdtemp(prefix="fake-flaarum-")
+    self._server = ThreadingHTTPServer((host, port), self._handler_class())
+    self._server.daemon_threads = True
+    self._server.socket = self._ssl_context().wrap_socket(self._server.socket, server_side=True,
+      do_handshake_on_connect=False)
+    self.host, self.port = self._server.server_address[:2]
+    self._thread = None
+
+  def _ssl_context(self) -> ssl.SSLContext:
+    if shutil.which("openssl") is None:
+      raise RuntimeError("The fake flaarum server needs the 'openssl' command to make its certificate.")
+    cert = os.path.join(self._certdir, "cert.pem")
+    key = os.path.join(self._certdir, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key,
+      "-out", cert, "-days", "1", "-subj", "/CN=localhost"], check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+  def start(self) -> "FakeFlaarum":
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def serve_forever(self) -> None:
+    self._server.serve_forever()
+
+  def stop(self) -> None:
+    self._server.shutdown()
+    self._server.server_close()
+    shutil.rmtree(self._certdir, ignore_errors=True)
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.stop()
+
+  def seed(self, proj: str, structure: str, count: int, make_row) -> None:
+    # Creates the table if needed and adds 'count' rows from make_row(i).
+    table_obj = statements.parse_table_structure_stmt(structure)
+    with self.lock:
+      self.projects.add(proj)
+      table = self.tables.setdefault((proj, table_obj.table_name), _Table())
+      if not table.versions:
+        table.versions.append(statements.format_table_obj(table_obj))
+      for i in range(count):
+        row = {key: str(value) for key, value in make_row(i).items()}
+        row["id"] = table.next_id
+        row["_version"] = 1
+        table.rows[table.next_id] = row
+        table.next_id += 1
+
+  def _handler_class(self):
+    fake = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+      disable_nagle_algorithm = True
+
+      def log_message(self, format, *args):
+        pass
+
+      def reply(self, code: int, body: str) -> None:
+        body = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode("utf-8"), keep_blank_values=True).items()}
+        parts = [unquote(part) for part in self.path.strip("/").split("/")]
+        with fake.lock:
+          fake.requests[parts[0]] = fake.requests.get(parts[0], 0) + 1
+        if fake.latency:
+          time.sleep(fake.latency)
+        try:
+          with fake.lock:
+            code, body = fake.handle(parts[0], parts[1:], form)
+        except Exception as e:
+          code, body = 400, str(e)
+        self.reply(code, body)
+
+    return Handler
+
+  def _table(self, proj: str, name: str) -> _Table:
+    table = self.tables.get((proj, name))
+    if table is None:
+      raise ValueError("table '%s' does not exist" % name)
+    return table
+
+  def handle(self, endpoint: str, args: list, form: dict):
+    if endpoint == "is-flaarum":
+      return 200, "yeah-flaarum"
+    if endpoint == "list-projects":
+      return 200, json.dumps(sorted(self.projects))
+    if endpoint == "create-project":
+      self.projects.add(args[0])
+      return 200, "ok"
+    if endpoint == "delete-project":
+      self.projects.discard(args[0])
+      return 200, "ok"
+    if endpoint == "rename-project":
+      self.projects.discard(args[0])
+      self.projects.add(args[1])
+      return 200, "ok"
+    if endpoint in ("create-table", "update-table-structure"):
+      table_obj = statements.parse_table_structure_stmt(form["stmt"])
+      table = self.tables.setdefault((args[0], table_obj.table_name), _Table())
+      table.versions.append(statements.format_table_obj(table_obj))
+      return 200, "ok"
+    if endpoint == "list-tables":
+      return 200, json.dumps([name for proj, name in self.tables if proj == args[0]])
+    if endpoint == "get-current-version-num":
+      return 200, str(len(self._table(args[0], args[1]).versions))
+    if endpoint == "get-table-structure":
+      return 200, self._table(args[0], args[1]).versions[int(args[2]) - 1]
+    if endpoint == "delete-table":
+      self.tables.pop((args[0], args[1]), None)
+      return 200, "ok"
+    if endpoint == "insert-row":
+      table = self._table(args[0], args[1])
+      row = {key: value for key, value in form.items() if key != "key-str"}
+      row["id"] = table.next_id
+      row["_version"] = 1
+      table.rows[table.next_id] = row
+      table.next_id += 1
+      return 200, str(row["id"])
+    if endpoint == "all-rows-count":
+      return 200, str(len(self._table(args[0], args[1]).rows))
+    if endpoint in ("search-table", "count-rows", "delete-rows", "update-rows"):
+      stmt_obj = statements.parse_search_stmt(form["stmt"])
+      table = self._table(args[0], stmt_obj.table)
+      rows = [row for row in table.rows.values() if _matches(row, stmt_obj.WhereOptions)]
+      rows = rows[stmt_obj.start_index:]
+      if stmt_obj.limit:
+        rows = rows[:stmt_obj.limit]
+
+      if endpoint == "count-rows":
+        return 200, str(len(rows))
+      if endpoint == "delete-rows":
+        for row in rows:
+          del table.rows[row["id"]]
+        return 200, "ok"
+      if endpoint == "update-rows":
+        i = 1
+        while "set%d_k" % i in form:
+          for row in rows:
+            row[form["set%d_k" % i]] = form["set%d_v" % i]
+          i += 1
+        return 200, "ok"
+      if form.get("query-one") == "t":
+        if not rows:
+          return 400, "Not Found"
+        return 200, json.dumps(rows[0])
+      return 200, json.dumps(rows)
+
+    return 404, "unknown endpoint '%s'" % endpoint
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Run a stand-in flaarum server for benchmarks.")
+  parser.add_argument("--port", type=int, default=22318)
+  parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+  args = parser.parse_args()
+  server = FakeFlaarum(latency=args.latency, port=args.port)
+  print("fake flaarum listening on https://%s:%d/" % (server.host, server.port), flush=True)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    server.stop()
@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pyflaarum import statements
+import legacy_statements
+
+
+SINGLE_WHERE = """
+  table: users
+  order_by: id asc
+  where:
+    name = a
+    or name = b
+    or name = c
+  """
+
+MULTI_WHERE = """
+  table: sales expand
+  fields: amount customer customer.name
+  start_index: 10
+  limit: 50
+  order_by: amount desc
+  joiner: and
+  where1:
+    amount > 100
+    and amount < 100000
+    and region = west
+  ::
+  where2:
+    customer.age > 18
+    or customer.vip = t
+  ::
+  where3:
+    status in paid shipped delivered returned
+  ::
+  where4:
+    created > 2020-01-01
+    and created < 2024-12-31
+  ::
+  """
+
+
+def bench(fn, stmt: str, number: int) -> float:
+  return min(timeit.repeat(lambda: fn(stmt), number=number, repeat=5)) / number
+
+
+def run(number: int = 2000) -> dict:
+  results = {}
+  for name, stmt in (("single_where", SINGLE_WHERE), ("multi_where", MULTI_WHERE)):
+    old = bench(legacy_statements.parse_search_stmt, stmt, number)
+    new = bench(statements._parse_search_stmt, stmt, number)
+    cached = bench(statements.parse_search_stmt, stmt, number)
+    results[name] = {"legacy_us": old * 1e6, "single_pass_us": new * 1e6, "cached_us": cached * 1e6, "speedup": old / new}
+
+  line = "status in paid shipped delivered returned cancelled refunded pending"
+  old = bench(legacy_statements.special_split_line, line, number * 5)
+  new = bench(statements.special_split_line, line, number * 5)
+  results["special_split_line"] = {"legacy_us": old * 1e6, "single_pass_us": new * 1e6, "speedup": old / new}
+  return results
+
+
+if __name__ == "__main__":
+  print(json.dumps(run(), indent=2))
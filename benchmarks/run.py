@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pyflaarum
+from pyflaarum import statements
+from fake_server import FakeFlaarum
+import parse_search_stmt
+
+
+# Measures pyflaarum's own overhead against the in-process fake flaarum
+# server and prints the results as JSON, so runs of different releases can
+# be diffed.
+
+PROJ = "bench"
+STRUCTURE = """table: items
+fields:
+  name string required
+  category string
+  price int
+  notes text
+::
+"""
+
+
+def make_row(i: int, row_bytes: int) -> dict:
+  return {"name": "item-%d" % i, "category": "cat-%d" % (i % 10), "price": i, "notes": "n" * row_bytes}
+
+
+def percentiles(samples: list) -> dict:
+  samples = sorted(samples)
+  def pick(q: float) -> float:
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+
+  return {"n": len(samples), "mean_ms": statistics.mean(samples) * 1000, "p50_ms": pick(0.50),
+    "p90_ms": pick(0.90), "p99_ms": pick(0.99), "max_ms": samples[-1] * 1000}
+
+
+def bench_method(fn, iterations: int, concurrency: int) -> dict:
+  try:
+    fn()
+  except Exception as e:
+    return {"error": "%s: %s" % (e.__class__.__name__, getattr(e, "msg", e))}
+
+  latencies = []
+  for _ in range(iterations):
+    start = time.perf_counter()
+    fn()
+    latencies.append(time.perf_counter() - start)
+  result = percentiles(latencies)
+  result["serial_ops_per_s"] = iterations / sum(latencies)
+
+  start = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    for future in [executor.submit(fn) for _ in range(iterations)]:
+      future.result()
+  result["concurrent_ops_per_s"] = iterations / (time.perf_counter() - start)
+  result["concurrency"] = concurrency
+  return result
+
+
+def bench_client(args) -> dict:
+  results = {}
+  with FakeFlaarum(latency=args.latency) as server:
+    server.seed(PROJ, STRUCTURE, args.rows, lambda i: make_row(i, args.row_bytes))
+    cl = pyflaarum.flaacl(server.host, "bench-key", PROJ, port=server.port, pool_size=args.concurrency)
+    page = "table: items\nlimit: %d" % args.page_rows
+    one = "table: items\nwhere:\n  id = 7"
+    counter = iter(range(10 ** 9))
+
+    methods = {
+      "ping": cl.ping,
+      "list_projects": cl.list_projects,
+      "list_tables": cl.list_tables,
+      "current_table_version_num": lambda: cl.current_table_version_num("items"),
+      "table_structure": lambda: cl.table_structure("items", 1),
+      "current_table_structure_parsed": lambda: cl.current_table_structure_parsed("items"),
+      "all_rows_count": lambda: cl.all_rows_count("items"),
+      "count_rows": lambda: cl.count_rows("table: items\nwhere:\n  category = cat-3"),
+      "search_for_one": lambda: cl.search_for_one(one),
+      "search": lambda: cl.search(page),
+      "search_typed": lambda: cl.search(page, typed=True),
+      "search_columnar": lambda: cl.search(page, columnar=True),
+      "insert_row": lambda: cl.insert_row("items", make_row(next(counter), args.row_bytes)),
+      "get_by_ids": lambda: cl.get_by_ids("items", range(1, args.page_rows * 5 + 1), chunk_size=args.page_rows,
+        concurrency=args.concurrency),
+      "update_rows": lambda: cl.update_rows(one, {"category": "cat-x"}),
+      "update_rows_many": lambda: cl.update_rows_many([(one, {"category": "cat-x"})] * 20,
+        concurrency=args.concurrency),
+      "query_many": lambda: cl.query_many([("count", "table: items")] * 10 + [("search", page)] * 10,
+        concurrency=args.concurrency),
+    }
+    for name, fn in methods.items():
+      results[name] = bench_method(fn, args.iterations, args.concurrency)
+
+    rows = [make_row(i, args.row_bytes) for i in range(args.batch_rows)]
+    start = time.perf_counter()
+    ids = cl.insert_rows("items", rows, concurrency=args.concurrency)
+    elapsed = time.perf_counter() - start
+    results["insert_rows"] = {"rows": len(rows), "errors": sum(1 for i in ids if isinstance(i, Exception)),
+      "seconds": elapsed, "rows_per_s": len(rows) / elapsed, "concurrency": args.concurrency}
+
+    cl.close()
+
+  results["full_scan"] = bench_full_scan(args)
+  return results
+
+
+SCAN_SERVER = """
+import sys
+from fake_server import FakeFlaarum
+from run import PROJ, STRUCTURE, make_row
+rows, row_bytes, latency = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3])
+server = FakeFlaarum(latency=latency)
+server.seed(PROJ, STRUCTURE, rows, lambda i: make_row(i, row_bytes))
+print(server.port, flush=True)
+server.serve_forever()
+"""
+
+
+def bench_full_scan(args) -> dict:
+  # Time to first row and peak Python memory of reading a whole table. The
+  # server runs in a process of its own here, so tracemalloc only sees the
+  # memory of the client.
+  here = os.path.dirname(os.path.abspath(__file__))
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+  proc = subprocess.Popen([sys.executable, "-c", SCAN_SERVER, str(args.rows), str(args.row_bytes), str(args.latency)],
+    env=env, stdout=subprocess.PIPE, text=True)
+  try:
+    port = int(proc.stdout.readline())
+    cl = pyflaarum.flaacl("127.0.0.1", "bench-key", PROJ, port=port)
+    try:
+      return _full_scan(cl, args.rows)
+    finally:
+      cl.close()
+  finally:
+    proc.terminate()
+    proc.wait()
+
+
+def _full_scan(cl, rows: int) -> dict:
+  stmt = "table: items"
+  results = {"rows": rows}
+
+  def run(name, consume):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first, count = consume()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results[name] = {"first_row_ms": (first - start) * 1000, "total_ms": elapsed * 1000,
+      "rows": count, "peak_mib": peak / 1024 / 1024}
+
+  def consume_list():
+    rows = cl.search(stmt)
+    return time.perf_counter(), len(rows)
+
+  def consume_iter(iterator):
+    def consume():
+      first = None
+      count = 0
+      for _ in iterator():
+        if first is None:
+          first = time.perf_counter()
+        count += 1
+      return first or time.perf_counter(), count
+    return consume
+
+  run("search", consume_list)
+  run("search_stream", consume_iter(lambda: cl.search_stream(stmt)))
+  run("search_iter", consume_iter(lambda: cl.search_iter(stmt, page_size=1000)))
+  return results
+
+
+def bench_statements(number: int) -> dict:
+  table_stmt = STRUCTURE + "foreign_keys:\n  category categories on_delete_restrict\n::\n"
+  line = "category in 'cat one' cat-2 cat-3 'cat four' cat-5"
+
+  def per_call_us(fn, arg, number):
+    return min(timeit.repeat(lambda: fn(arg), number=number, repeat=5)) / number * 1e6
+
+  results = parse_search_stmt.run(number)
+  results["parse_table_structure_stmt"] = {"us": per_call_us(statements.parse_table_structure_stmt, table_stmt, number)}
+  results["special_split_line_quoted"] = {"us": per_call_us(statements.special_split_line, line, number * 5)}
+
+  # an f-string statement parsed from scratch against a bound prepared one.
+  template = "table: items\nlimit: {limit}\nwhere:\n  category = {category}\n  and price > {price}\n"
+  prepared = statements.prepare(template)
+  values = {"limit": 50, "category": "cat one", "price": 10}
+  results["formatted_and_parsed"] = {"us": per_call_us(lambda v: statements._parse_search_stmt(
+    "table: items\nlimit: %d\nwhere:\n  category = '%s'\n  and price > '%s'\n" % (v["limit"], v["category"], v["price"])),
+    values, number)}
+  results["prepared_bind"] = {"us": per_call_us(lambda v: prepared.bind(**v), values, number)}
+  return results
+
+
+IMPORT_PROBE = """
+import json, sys, time
+base = set(sys.modules)
+start = time.perf_counter()
+import pyflaarum
+imported = time.perf_counter()
+from pyflaarum import statements
+statements.parse_search_stmt("table: items\\nwhere:\\n  name = x")
+done = time.perf_counter()
+stdlib = getattr(sys, "stdlib_module_names", None)
+loaded = set(sys.modules) - base
+top = sorted(set(name.split(".")[0] for name in loaded))
+third_party = [name for name in top if stdlib is not None and name not in stdlib and name != "pyflaarum"]
+print(json.dumps([imported - start, done - start, len(loaded), third_party]))
+"""
+
+
+def bench_import(runs: int) -> dict:
+  # Every run is a fresh interpreter, so nothing is imported already.
+  src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src, os.environ.get("PYTHONPATH")])))
+  samples = []
+  for _ in range(runs):
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], env=env, check=True, capture_output=True, text=True)
+    samples.append(json.loads(out.stdout))
+  return {
+    "import_ms": min(sample[0] for sample in samples) * 1000,
+    "import_and_parse_ms": min(sample[1] for sample in samples) * 1000,
+    "modules_loaded": samples[0][2],
+    "third_party_modules": samples[0][3],
+    "runs": runs,
+  }
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser(description="Benchmark pyflaarum against a local fake flaarum server.")
+  parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake server adds to every reply")
+  parser.add_argument("--rows", type=int, default=20000, help="rows seeded into the benchmark table")
+  parser.add_argument("--row-bytes", type=int, default=64, help="size of the text field of every row")
+  parser.add_argument("--page-rows", type=int, default=100, help="limit used by the search benchmarks")
+  parser.add_argument("--batch-rows", type=int, default=2000, help="rows sent through insert_rows")
+  parser.add_argument("--iterations", type=int, default=200)
+  parser.add_argument("--concurrency", type=int, default=8)
+  parser.add_argument("--skip-client", action="store_true", help="only run the statement micro-benchmarks")
+  parser.add_argument("--out", help="write the JSON results to this file instead of stdout")
+  args = parser.parse_args()
+
+  report = {
+    "python": platform.python_version(),
+    "platform": platform.platform(),
+    "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    "settings": vars(args),
+    "import": bench_import(10),
+    "statements": bench_statements(2000),
+  }
+  if not args.skip_client:
+    report["client"] = bench_client(args)
+
+  text = json.dumps(report, indent=2)
+  if args.out:
+    with open(args.out, "w") as f:
+      f.write(text + "\n")
+  else:
+    print(text)
+
+
+if __name__ == "__main__":
+  main()
@@ -1,99 +1,395 @@
-import requests
+import functools
 import json
+import time
+from urllib.parse import urlencode
+from collections import deque
 from . import statements
 from . import objects
-from typing import List, Dict
+from . import validation
+from . import decoding
+from . import instrumentation
+from .instrumentation import CallEvent, MetricsAggregator
+from .statements import BoundStmt, PreparedStmt, prepare
+from .errors import flaa_error
+from .transport import Transport, TransportError, HTTPTransport, RequestsTransport
+from .cache import SchemaCache, ResultCache
+from .resilience import CircuitBreaker, Resilience, RetryPolicy
+from .singleflight import SingleFlight
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Tuple, Union
 
-requests.packages.urllib3.disable_warnings()
+HTTP_OK = 200
+HTTP_BAD_REQUEST = 400
 
-class flaa_error(Exception):
-  def __init__(self, code: int, msg: str):
-    self.msg = msg
-    self.code = code
-    self.message = "Error Code: " + str(code) + "\n" + msg
+# The endpoints that only read, so they can be retried and hedged.
+READ_ENDPOINTS = frozenset(["is-flaarum", "list-projects", "list-tables", "get-current-version-num",
+  "get-table-structure", "search-table", "count-rows", "all-rows-count"])
+
+
+def __getattr__(name: str):
+  # aflaacl pulls in asyncio, so it is only imported when asked for.
+  # flaacluster is built on flaacl and is imported the same way.
+  if name == "aflaacl":
+    from .aio import aflaacl
+    return aflaacl
+  if name == "flaacluster":
+    from .cluster import flaacluster
+    return flaacluster
+  raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def _instrumented(fn):
+  # Marks a flaacl method whose requests are reported to the client's hooks.
+  # Without hooks the method is called straight away.
+  method = fn.__name__
+  params = list(fn.__code__.co_varnames[:fn.__code__.co_argcount])
+  table_index = params.index("table") - 1 if "table" in params else None
+
+  @functools.wraps(fn)
+  def wrapper(self, *args, **kwargs):
+    if not self._hooks:
+      return fn(self, *args, **kwargs)
+
+    table = ""
+    if table_index is not None:
+      table = kwargs.get("table", args[table_index] if len(args) > table_index else "")
+    frame = instrumentation._Frame(self, method, table)
+    instrumentation.push_frame(frame)
+    error_code = None
+    try:
+      return fn(self, *args, **kwargs)
+    except flaa_error as e:
+      error_code = e.code
+      raise
+    finally:
+      instrumentation.pop_frame()
+      self._emit_frame(frame, error_code)
+
+  return wrapper
+
+
+def _body_bytes(robj) -> int:
+  # The length of a response body in bytes, from the transport when it says.
+  size = getattr(robj, "size", None)
+  if size is not None:
+    return size
+  content = getattr(robj, "content", None)
+  if isinstance(content, bytes):
+    return len(content)
+  return len(robj.text.encode("utf-8"))
+
+
+def _row_id(value: Any) -> Optional[int]:
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return None
 
 
 class flaacl:
-  def __init__(self, ip: str, key_str: str, proj: str, port=22318):
+  def __init__(self, ip: str, key_str: str, proj: str, port=22318, pool_size: int = 10,
+      keep_alive: bool = True, timeout: Optional[float] = None, transport: Optional[Transport] = None,
+      schema_ttl: Optional[float] = 60.0, result_cache: Optional[ResultCache] = None,
+      coalesce: bool = False, resilience: Optional[Resilience] = None):
     self.ip = ip
     self.key_str = key_str
     self.proj = proj
     self.port = port
     self.addr = "https://" + self.ip + ":" + str(self.port) + "/"
+    self.timeout = timeout
+    self._owns_transport = transport is None
+    if transport is None:
+      transport = HTTPTransport(pool_size=pool_size, keep_alive=keep_alive)
+    self.transport = transport
+    self.schema_cache = SchemaCache(ttl=schema_ttl)
+    self._compiled = {}
+    self.result_cache = result_cache
+    self.single_flight = SingleFlight() if coalesce else None
+    self._hooks = ()
+    self.resilience = resilience
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self) -> None:
+    if self._owns_transport:
+      self.transport.close()
+
+  def add_hook(self, hook: Callable[[CallEvent], None]) -> None:
+    # hook is called with a CallEvent for every request this client makes.
+    self._hooks = self._hooks + (hook,)
+
+  def remove_hook(self, hook: Callable[[CallEvent], None]) -> None:
+    self._hooks = tuple(h for h in self._hooks if h is not hook)
+
+  def _fire(self, event: CallEvent) -> None:
+    for hook in self._hooks:
+      try:
+        hook(event)
+      except Exception:
+        pass
+
+  def _emit_frame(self, frame: instrumentation._Frame, error_code: Optional[int]) -> None:
+    if not frame.requests:
+      if error_code is not None:
+        self._fire(CallEvent(frame.method, "", self.proj, frame.table, frame.parse_seconds, error_code=error_code))
+      return
+
+    last = len(frame.requests) - 1
+    for i, (path, network_seconds, request_bytes, response_bytes, status_code) in enumerate(frame.requests):
+      self._fire(CallEvent(frame.method, path, self.proj, frame.table, frame.parse_seconds if i == 0 else 0.0,
+        network_seconds, request_bytes, response_bytes, status_code, error_code if i == last else None))
+
+  def _record_request(self, rurl: str, data: Dict[str, str], start: float, robj, read_body: bool) -> None:
+    network_seconds = time.perf_counter() - start
+    path = rurl[len(self.addr):]
+    status_code = robj.status_code if robj is not None else 0
+    response_bytes = _body_bytes(robj) if robj is not None and read_body else 0
+    request = [path, network_seconds, len(urlencode(data)), response_bytes, status_code]
+
+    frame = instrumentation.current_frame(self)
+    if frame is not None and not frame.detached:
+      frame.requests.append(request)
+    else:
+      # requests of batch methods and iterators are reported on their own.
+      error_code = 11 if robj is None else None
+      method, table = (frame.method, frame.table) if frame is not None else (path.split("/")[0], "")
+      self._fire(CallEvent(method, path, self.proj, table, 0.0, *request[1:], error_code=error_code))
+
+  def _reporting(self, method: str, table: str, fn: Callable) -> Callable:
+    # Wraps fn so that the requests it makes, on whatever thread, are
+    # reported for the instrumented call running now, or else on their own
+    # under method.
+    if not self._hooks:
+      return fn
+    frame = instrumentation.current_frame(self)
+    if frame is None:
+      frame = instrumentation._Frame(self, method, table, detached=True)
+
+    def run(*args):
+      instrumentation.push_frame(frame)
+      try:
+        return fn(*args)
+      finally:
+        instrumentation.pop_frame()
+
+    return run
+
+  def _send(self, rurl: str, send: Callable[[], Any], hedge: bool):
+    if self.resilience is None:
+      return send()
+    endpoint = rurl[len(self.addr):].split("/", 1)[0]
+    return self.resilience.call(self.addr, endpoint, send, endpoint in READ_ENDPOINTS, hedge,
+      getattr(self.transport, "abort", None))
+
+  def _post(self, rurl: str, data: Dict[str, str]):
+    start = time.perf_counter() if self._hooks else 0.0
+    robj = None
+    try:
+      robj = self._send(rurl, lambda: self.transport.post(rurl, data, timeout=self.timeout), True)
+      return robj
+    except TransportError as e:
+      raise flaa_error(11, e.msg)
+    finally:
+      if start:
+        self._record_request(rurl, data, start, robj, True)
+
+  def _post_stream(self, rurl: str, data: Dict[str, str], chunk_size: int):
+    start = time.perf_counter() if self._hooks else 0.0
+    robj = None
+    try:
+      robj = self._send(rurl, lambda: self.transport.post_stream(rurl, data, timeout=self.timeout,
+        chunk_size=chunk_size), False)
+      return robj
+    except TransportError as e:
+      raise flaa_error(11, e.msg)
+    finally:
+      if start:
+        self._record_request(rurl, data, start, robj, False)
+
+  def _note_parse(self, start: float, table: str) -> None:
+    frame = instrumentation.current_frame(self)
+    if frame is not None:
+      frame.parse_seconds += time.perf_counter() - start
+      if not frame.table:
+        frame.table = table
+
+  def _fan_out(self, fn: Callable, items: Iterable, concurrency: int, method: str, table: str = "") -> list:
+    # Runs fn over items on at most 'concurrency' threads and returns the
+    # results in input order. A failing item gets its exception in place of a
+    # result. Only a small window of futures is held, so items can be a
+    # generator of any length. Requests are reported under method.
+    concurrency = max(1, concurrency)
+    fn = self._reporting(method, table, fn)
+    results = []
+    window = deque()
 
+    def collect():
+      future = window.popleft()
+      try:
+        results.append(future.result())
+      except Exception as e:
+        results.append(e)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+      for item in items:
+        window.append(executor.submit(fn, item))
+        if len(window) >= concurrency * 2:
+          collect()
+      while window:
+        collect()
+
+    return results
+
+  def _parse_search(self, stmt: str) -> objects.Stmt:
+    start = time.perf_counter() if self._hooks else 0.0
+    try:
+      stmt_obj = statements.parse_search_stmt(stmt)
+    except Exception as e:
+      if start:
+        self._note_parse(start, "")
+      raise flaa_error(12, str(e))
+    if start:
+      self._note_parse(start, stmt_obj.table)
+    return stmt_obj
+
+  def _statement(self, stmt: Union[str, statements.BoundStmt]) -> Tuple[str, str]:
+    # Returns the text and table of a search statement. A BoundStmt was
+    # checked when it was prepared, so it is not parsed again.
+    if isinstance(stmt, statements.BoundStmt):
+      return stmt.stmt, stmt.table
+    return stmt, self._parse_search(stmt).table
+
+  def _coalesced(self, key: tuple, fetch: Callable[[], Any]) -> Any:
+    # With coalesce on, identical reads in flight at the same time share one
+    # request and its result (or error).
+    if self.single_flight is None:
+      return fetch()
+    return self.single_flight.do(key, fetch)
+
+  def _cached_read(self, kind: str, stmt: str, table: str, fetch: Callable[[], Tuple[Any, int]]) -> Any:
+    # fetch returns the result and the size of the response body. Results
+    # served from the cache are shared and must not be changed.
+    cache = self.result_cache
+    if cache is None:
+      return self._coalesced((self.proj, kind, stmt), fetch)[0]
+
+    key = (self.proj, kind, statements.normalize_stmt(stmt))
+    found, value = cache.get(key)
+    if found:
+      return value
+    generation = cache.generation(self.proj, table)
+    value, size = self._coalesced(key, fetch)
+    cache.put(key, self.proj, table, value, size + len(key[2]), generation)
+    return value
+
+  def _invalidate_results(self, table: str) -> None:
+    if self.result_cache is not None:
+      self.result_cache.invalidate(self.proj, table)
+
+  def _invalidate_schema(self, stmt: str) -> None:
+    try:
+      table_name = statements.parse_table_structure_stmt(stmt).table_name
+    except Exception:
+      self.schema_cache.invalidate(self.proj)
+    else:
+      self.schema_cache.invalidate(self.proj, table_name)
+
+  @_instrumented
   def ping(self) -> None:
     data = {"key-str": self.key_str}
-    robj = requests.post(self.addr + "is-flaarum", data=data, verify=False)
+    robj = self._post(self.addr + "is-flaarum", data)
 
-    if robj.status_code != requests.codes.ok:
+    if robj.status_code != HTTP_OK:
       raise flaa_error(10, "Unexpected Error in confirming that the server is a flaarum store.")
   
+  @_instrumented
   def create_project(self, proj: str) -> None:
     data = {"key-str": self.key_str}
     rurl = self.addr + "create-project/" + proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code != requests.codes.ok:
+    robj = self._post(rurl, data)
+    if robj.status_code != HTTP_OK:
       raise flaa_error(10, robj.text)
   
+  @_instrumented
   def delete_project(self, proj: str) -> None:
     data = {"key-str": self.key_str}
     rurl = self.addr + "delete-project/" + proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code != requests.codes.ok:
+    robj = self._post(rurl, data)
+    if robj.status_code != HTTP_OK:
       raise flaa_error(10, robj.text)
   
+  @_instrumented
   def list_projects(self):
     data = {"key-str": self.key_str}
-    robj = requests.post(self.addr + "list-projects", data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
+    robj = self._post(self.addr + "list-projects", data)
+    if robj.status_code == HTTP_OK:
       return json.loads(robj.text)
     else:
       raise flaa_error(11, robj.text)
   
+  @_instrumented
   def rename_project(self, proj: str, new_proj: str):
     data = {"key-str": self.key_str}
     rurl = self.addr +"rename-project/"+proj+"/"+new_proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code != requests.codes.ok:
+    robj = self._post(rurl, data)
+    if robj.status_code != HTTP_OK:
       raise flaa_error(11, robj.text)
   
+  @_instrumented
   def create_table(self, stmt: str):
     data = {"key-str": self.key_str, "stmt": stmt}
     rurl = self.addr +"create-table/"+ self.proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code != requests.codes.ok:
+    robj = self._post(rurl, data)
+    self._invalidate_schema(stmt)
+    if robj.status_code != HTTP_OK:
       raise flaa_error(11, robj.text)
   
+  @_instrumented
   def update_table_structure(self, stmt: str):
     data = {"key-str": self.key_str, "stmt": stmt}
     rurl = self.addr +"update-table-structure/"+ self.proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code != requests.codes.ok:
+    robj = self._post(rurl, data)
+    self._invalidate_schema(stmt)
+    if robj.status_code != HTTP_OK:
       raise flaa_error(11, robj.text)
   
+  @_instrumented
   def list_tables(self):
+    return self._coalesced((self.proj, "list_tables"), self._list_tables)
+
+  def _list_tables(self):
     data = {"key-str": self.key_str}
     rurl = self.addr + "list-tables/" + self.proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
+    robj = self._post(rurl, data)
+    if robj.status_code == HTTP_OK:
       return json.loads(robj.text)
     else:
       raise flaa_error(11, robj.text)
   
+  @_instrumented
   def current_table_version_num(self, table: str) -> int:
     data = {"key-str": self.key_str}
     rurl = "%sget-current-version-num/%s/%s" % (self.addr, self.proj, table)
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
+    robj = self._post(rurl, data)
+    if robj.status_code == HTTP_OK:
       return int(robj.text.strip())
     else:
       raise flaa_error(11, robj.text)
   
+  @_instrumented
   def table_structure(self, table: str, version: int) -> str:
+    return self._coalesced((self.proj, "table_structure", table, version), lambda: self._table_structure(table, version))
+
+  def _table_structure(self, table: str, version: int) -> str:
     data = {"key-str": self.key_str}
     rurl = "%sget-table-structure/%s/%s/%d" % (self.addr, self.proj, table, version)
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
+    robj = self._post(rurl, data)
+    if robj.status_code == HTTP_OK:
       return robj.text
     else:
       raise flaa_error(11, robj.text)
@@ -105,7 +401,15 @@ class flaacl:
   def current_table_structure_parsed(self, table: str) -> objects.Table:
     version = self.current_table_version_num(table)
     stmt = self.table_structure(table, version)
-    return statements.parse_table_structure_stmt(stmt)
+    table_obj = statements.parse_table_structure_stmt(stmt)
+    self.schema_cache.put(self.proj, table, table_obj, version)
+    return table_obj
+
+  def cached_table_structure_parsed(self, table: str) -> objects.Table:
+    entry = self.schema_cache.get(self.proj, table)
+    if entry is not None:
+      return entry[0]
+    return self.current_table_structure_parsed(table)
   
   def create_or_update_table(self, stmt: str) -> None:
     tables = self.list_tables()
@@ -118,61 +422,120 @@ class flaacl:
       if old_stmt != statements.format_table_obj(table_obj):
         self.update_table_structure(stmt)
 
+  def sync_tables(self, stmts: Iterable[str], concurrency: int = 8) -> Dict[str, Any]:
+    # Creates or updates many tables at once. The existing structures are
+    # fetched concurrently, and the changed tables are applied in rounds so a
+    # table comes after the tables its foreign keys point to. The tables of a
+    # round are applied concurrently. Returns the names of the created,
+    # updated and unchanged tables, the errors by table name, and the names
+    # of tables skipped because a table they point to failed.
+    table_objs = {}
+    for stmt in stmts:
+      try:
+        table_obj = statements.parse_table_structure_stmt(stmt)
+      except Exception as e:
+        raise flaa_error(12, str(e))
+      if table_obj.table_name in table_objs:
+        raise flaa_error(12, "The table '%s' is given more than once." % table_obj.table_name)
+      table_objs[table_obj.table_name] = (stmt, table_obj)
+
+    report = {"created": [], "updated": [], "unchanged": [], "errors": {}, "skipped": []}
+    tables = self.list_tables()
+    existing = [name for name in table_objs if name in tables]
+
+    def fetch(name: str) -> str:
+      version = self.current_table_version_num(name)
+      return self.table_structure(name, version)
+
+    actions = {name: "create" for name in table_objs if name not in tables}
+    for name, old_stmt in zip(existing, self._fan_out(fetch, existing, concurrency, "sync_tables")):
+      if isinstance(old_stmt, Exception):
+        report["errors"][name] = old_stmt
+        continue
+      new_stmt = statements.format_table_obj(table_objs[name][1])
+      try:
+        old_stmt = statements.format_table_obj(statements.parse_table_structure_stmt(old_stmt))
+      except Exception:
+        pass
+      if old_stmt == new_stmt:
+        report["unchanged"].append(name)
+      else:
+        actions[name] = "update"
+
+    depends_on = {}
+    for name in actions:
+      depends_on[name] = set(fkey.pointed_table for fkey in table_objs[name][1].foreign_keys
+        if fkey.pointed_table in actions and fkey.pointed_table != name)
+
+    def apply(name: str) -> None:
+      if actions[name] == "create":
+        self.create_table(table_objs[name][0])
+      else:
+        self.update_table_structure(table_objs[name][0])
+
+    cycle = set(depends_on)
+    while True:
+      leaves = [name for name in cycle if not depends_on[name] & cycle]
+      if not leaves:
+        break
+      cycle.difference_update(leaves)
+    if cycle:
+      raise flaa_error(12, "The foreign keys of the tables %s form a cycle." % ", ".join(sorted(cycle)))
+
+    done = set()
+    while depends_on:
+      ready = [name for name, deps in depends_on.items() if deps <= done]
+      if not ready:
+        # whatever is left points to a table that failed or was skipped.
+        report["skipped"].extend(sorted(depends_on))
+        break
+
+      for name in ready:
+        del depends_on[name]
+      for name, result in zip(ready, self._fan_out(apply, ready, concurrency, "sync_tables")):
+        if isinstance(result, Exception):
+          report["errors"][name] = result
+        else:
+          report["created" if actions[name] == "create" else "updated"].append(name)
+          done.add(name)
+
+    return report
+
+  @_instrumented
   def delete_table(self, table: str) -> None:
     data = {"key-str": self.key_str}
     rurl = self.addr + "delete-table/" + self.proj + "/" + table
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code != requests.codes.ok:
+    robj = self._post(rurl, data)
+    self.schema_cache.invalidate(self.proj, table)
+    self._invalidate_results(table)
+    if robj.status_code != HTTP_OK:
       raise flaa_error(10, robj.text)
   
-  def insert_row(self, table: str, to_insert: dict) -> int:
+  def _compile_for_table(self, table: str, compile_fn: Callable[[objects.Table], Callable]) -> Callable:
+    # compile_fn runs again only when the cached table structure changes.
+    table_obj = self.cached_table_structure_parsed(table)
+    key = (self.proj, table, compile_fn)
+    cached = self._compiled.get(key)
+    if cached is not None and cached[0] is table_obj:
+      return cached[1]
+    compiled = compile_fn(table_obj)
+    self._compiled[key] = (table_obj, compiled)
+    return compiled
+
+  def _row_validator(self, table: str) -> Callable[[dict], dict]:
+    return self._compile_for_table(table, validation.compile_row_validator)
+
+  def _insert_validated(self, table: str, to_insert: dict) -> int:
     data = {"key-str": self.key_str}
     for key, value in to_insert.items():
       data[key] = value
-    
-    table_obj = self.current_table_structure_parsed(table)
-    fields = []
-    for field_obj in table_obj.fields:
-      fields.append(field_obj.field_name)
-    
-    for key, value in to_insert:
-      if key == "id" or key == "_version":
-        msg = "The field '%s' would be generated. Please remove." % (key)
-        raise flaa_error(20, msg)
-      
-      if not key in fields:
-        msg = "The field '%s' is not part of this table structure" % (key)
-        raise flaa_error(20, msg)
-    
-    for field_obj in table_obj.fields:
-      if field_obj.field_type == "string":
-        v = to_insert.get(field_obj.field_name, "")
-
-        if len(v) > 200:
-          msg = "The value '%s' to field '%s' is longer than 200 characters" % (v, field_obj.field_name)
-          raise flaa_error(24, msg)
-        
-        if "\n" in v or "\r\n" in v:
-          msg = "The value of field '%s' contains new line." % field_obj.field_name
-      
-      if field_obj.field_type == "int" and field_obj.field_type in to_insert:
-        v = to_insert[field_obj.field_name]
-        if type(v) != str:
-          try:
-            int(v)
-          except:
-            msg = "The value '%s' to field '%s' is not of type 'int'" % (v, field_obj.field_name)
-            raise flaa_error(24, msg)
-
-      if not field_obj.field_name in to_insert and hasattr(field_obj, "required") and field_obj.required:
-        msg = "The field '%s' is required." % field_obj.field_name
-        raise flaa_error(20, msg)
 
     rurl = "%sinsert-row/%s/%s" % (self.addr, self.proj, table)
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
+    robj = self._post(rurl, data)
+    self._invalidate_results(table)
+    if robj.status_code == HTTP_OK:
       return int(robj.text.strip())
-    elif robj.status_code == requests.codes.bad_request:
+    elif robj.status_code == HTTP_BAD_REQUEST:
       if robj.text.strip().startswith("UE:"):
         raise flaa_error(21, robj.text.strip()[3:])
       elif robj.text.strip().startswith("FKE:"):
@@ -181,89 +544,316 @@ class flaacl:
         raise flaa_error(20, robj.text.strip())
     else:
       raise flaa_error(11, robj.text)
-    
-  def __parserow(self, obj: Dict[str, str]) -> Dict[str, any]:
-    pass
 
-  def search(self, stmt: str) -> List[Dict[str, str]]:
-    data = {"key-str": self.key_str, "stmt": stmt}
+  @_instrumented
+  def insert_row(self, table: str, to_insert: dict) -> int:
+    validator = self._row_validator(table)
+    start = time.perf_counter() if self._hooks else 0.0
     try:
-      statements.parse_search_stmt(stmt)
-    except Exception as e:
-      raise flaa_error(12, e.message)
-    
+      to_insert = validator(to_insert)
+    finally:
+      if start:
+        self._note_parse(start, table)
+    return self._insert_validated(table, to_insert)
+
+  def insert_rows(self, table: str, rows: Iterable[dict], concurrency: int = 8) -> List[Union[int, flaa_error]]:
+    validator = self._row_validator(table)
+
+    def insert(to_insert: dict) -> int:
+      return self._insert_validated(table, validator(to_insert))
+
+    return self._fan_out(insert, rows, concurrency, "insert_rows", table)
+
+  def _row_decoder(self, table: str) -> Callable[[dict], dict]:
+    return self._compile_for_table(table, decoding.compile_row_decoder)
+
+  def _search(self, stmt: str, table: str, typed: bool) -> Tuple[List[Dict[str, str]], int]:
+    data = {"key-str": self.key_str, "stmt": stmt}
     rurl = self.addr + "search-table/" + self.proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
-      tmpdict = json.loads(robj.text)
-      return tmpdict
+    robj = self._post(rurl, data)
+    if robj.status_code == HTTP_OK:
+      # the server answers null when nothing matched.
+      tmpdict = json.loads(robj.text) or []
+      if typed:
+        decode = self._row_decoder(table)
+        for row in tmpdict:
+          decode(row)
+      return tmpdict, len(robj.text)
     else:
       raise flaa_error(11, robj.text)
 
-  def search_for_one(self, stmt: str) -> Dict[str, str]:
-    data = {"key-str": self.key_str, "stmt": stmt, "query-one": "t"}
+  @_instrumented
+  def search(self, stmt: Union[str, statements.BoundStmt], typed: bool = False, columnar: bool = False):
+    # typed turns 'int' fields, 'id' and '_version' into ints using the
+    # table structure. columnar returns a dict of column name to values
+    # instead of a list of rows, with 'int' columns packed into array('q').
+    stmt, table = self._statement(stmt)
+    typed = typed or columnar
+    kind = "search_typed" if typed else "search"
+    tmpdict = self._cached_read(kind, stmt, table, lambda: self._search(stmt, table, typed))
+    if columnar:
+      return decoding.to_columns(tmpdict, self.cached_table_structure_parsed(table))
+    return tmpdict
+
+  def search_iter(self, stmt: Union[str, statements.BoundStmt], page_size: int = 1000,
+      typed: bool = False) -> Iterator[Dict[str, str]]:
+    # Yields the rows of stmt page by page. The next page is fetched in the
+    # background while the current one is consumed, so at most two pages are
+    # held at a time. The statement's own start_index and limit still apply,
+    # so a BoundStmt is parsed too.
+    stmt = str(stmt)
+    stmt_obj = self._parse_search(stmt)
+    start_index = stmt_obj.start_index
+    remaining = stmt_obj.limit or None
+
+    def fetch(start_index: int, limit: int) -> List[Dict[str, str]]:
+      # pages skip the result cache so a scan does not flush it.
+      return self._search(statements.set_search_stmt_range(stmt, start_index, limit), stmt_obj.table, typed)[0]
+    fetch = self._reporting("search_iter", stmt_obj.table, fetch)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+      limit = page_size if remaining is None else min(page_size, remaining)
+      future = executor.submit(fetch, start_index, limit)
+      while future is not None:
+        page = future.result()
+        future = None
+        start_index += limit
+        if remaining is not None:
+          remaining -= len(page)
+        if len(page) == limit and remaining != 0:
+          limit = page_size if remaining is None else min(page_size, remaining)
+          future = executor.submit(fetch, start_index, limit)
+
+        for row in page:
+          yield row
+        page = None
+
+  def search_stream(self, stmt: Union[str, statements.BoundStmt], typed: bool = False,
+      chunk_size: int = 65536) -> Iterator[Dict[str, str]]:
+    # Yields the rows of stmt as they are decoded from the response body,
+    # without holding the whole body or result list in memory.
+    stmt, table = self._statement(stmt)
+    data = {"key-str": self.key_str, "stmt": stmt}
+    decode = self._row_decoder(table) if typed else None
+
+    rurl = self.addr + "search-table/" + self.proj
+    robj = self._reporting("search_stream", table, self._post_stream)(rurl, data, chunk_size)
     try:
-      statements.parse_search_stmt(stmt)
-    except Exception as e:
-      raise flaa_error(12, e.message)
-    
+      if robj.status_code != HTTP_OK:
+        raise flaa_error(11, robj.text)
+
+      for row in decoding.iter_json_array(robj.chunks):
+        if decode is not None:
+          decode(row)
+        yield row
+    except TransportError as e:
+      raise flaa_error(11, e.msg)
+    finally:
+      robj.close()
+
+  def _id_stmts(self, table: str, ids: List[int], fields: Optional[List[str]], chunk_size: int) -> List[Tuple[str, str]]:
+    # (table, stmt) pairs of 'id in' statements of at most chunk_size ids.
+    if fields is not None and "id" not in fields:
+      fields = list(fields) + ["id"]
+    head = "table: %s\n" % table
+    if fields:
+      head += "fields: %s\n" % " ".join(fields)
+
+    chunk_size = max(1, chunk_size)
+    return [(table, "%slimit: %d\nwhere:\n  id in %s\n" % (head, len(chunk), " ".join(str(i) for i in chunk)))
+      for chunk in (ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size))]
+
+  def _fetch_by_ids(self, id_stmts: List[Tuple[str, str]], typed: bool, concurrency: int) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    # Runs the statements of _id_stmts concurrently and returns the rows by
+    # (table, id). They skip the result cache, as they are unlikely to be
+    # asked for again.
+    def fetch(id_stmt: Tuple[str, str]) -> List[Dict[str, Any]]:
+      table, stmt = id_stmt
+      return self._search(stmt, table, typed)[0]
+
+    found = {}
+    for (table, _), result in zip(id_stmts, self._fan_out(fetch, id_stmts, concurrency, "get_by_ids")):
+      if isinstance(result, Exception):
+        raise result
+      for row in result:
+        found[(table, int(row["id"]))] = row
+    return found
+
+  @_instrumented
+  def get_by_ids(self, table: str, ids: Iterable[Union[int, str]], fields: Optional[List[str]] = None,
+      typed: bool = False, chunk_size: int = 500, concurrency: int = 8) -> Tuple[List[Dict[str, Any]], List[int]]:
+    # Fetches the rows with the given ids using 'id in' statements of at most
+    # chunk_size ids, run concurrently. Returns the rows in the order of ids
+    # (repeated ids give one row) and the ids that were not found.
+    wanted = list(dict.fromkeys(int(i) for i in ids))
+    found = self._fetch_by_ids(self._id_stmts(table, wanted, fields, chunk_size), typed, concurrency)
+    rows = [found[(table, i)] for i in wanted if (table, i) in found]
+    missing = [i for i in wanted if (table, i) not in found]
+    return rows, missing
+
+  @_instrumented
+  def search_related(self, stmt: Union[str, statements.BoundStmt], fields: Iterable[str], typed: bool = False,
+      chunk_size: int = 500, concurrency: int = 8) -> List[Dict[str, Any]]:
+    # Runs stmt, then fetches the rows its foreign key fields point to and
+    # puts each under field + "_row" (None when the field is empty or the
+    # row is gone). The foreign keys come from the table structure, and every
+    # pointed table is read with chunked 'id in' statements, so the cost is
+    # one request per pointed table and chunk instead of one per row.
+    stmt, table = self._statement(stmt)
+    fkeys = {fkey.field_name: fkey for fkey in self.cached_table_structure_parsed(table).foreign_keys}
+    fields = list(fields)
+    for field in fields:
+      if field not in fkeys:
+        raise flaa_error(12, "The field '%s' of table '%s' is not a foreign key." % (field, table))
+
+    rows = self.search(stmt, typed)
+    wanted = {}
+    for field in fields:
+      ids = wanted.setdefault(fkeys[field].pointed_table, {})
+      for row in rows:
+        value = _row_id(row.get(field))
+        if value is not None:
+          ids[value] = None
+
+    id_stmts = []
+    for pointed_table, ids in wanted.items():
+      id_stmts.extend(self._id_stmts(pointed_table, list(ids), None, chunk_size))
+    found = self._fetch_by_ids(id_stmts, typed, concurrency)
+
+    # the rows may be shared with the result cache, so copies are returned.
+    expanded = []
+    for row in rows:
+      row = dict(row)
+      for field in fields:
+        row[field + "_row"] = found.get((fkeys[field].pointed_table, _row_id(row.get(field))))
+      expanded.append(row)
+    return expanded
+
+  def _search_for_one(self, stmt: str, table: str, typed: bool) -> Tuple[Dict[str, str], int]:
+    data = {"key-str": self.key_str, "stmt": stmt, "query-one": "t"}
     rurl = self.addr + "search-table/" + self.proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
+    robj = self._post(rurl, data)
+    if robj.status_code == HTTP_OK:
       tmpdict = json.loads(robj.text)
-      return tmpdict
+      if typed:
+        self._row_decoder(table)(tmpdict)
+      return tmpdict, len(robj.text)
     else:
       raise flaa_error(11, robj.text)
+
+  @_instrumented
+  def search_for_one(self, stmt: Union[str, statements.BoundStmt], typed: bool = False) -> Dict[str, str]:
+    stmt, table = self._statement(stmt)
+    kind = "search_one_typed" if typed else "search_one"
+    return self._cached_read(kind, stmt, table, lambda: self._search_for_one(stmt, table, typed))
   
-  def delete_rows(self, stmt: str) -> None:
+  @_instrumented
+  def delete_rows(self, stmt: Union[str, statements.BoundStmt]) -> None:
+    stmt, table = self._statement(stmt)
     data = {"key-str": self.key_str, "stmt": stmt}
-    try:
-      statements.parse_search_stmt(stmt)
-    except Exception as e:
-      raise flaa_error(12, e.message)
     
     rurl = self.addr + "delete-rows/" + self.proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code != requests.codes.ok:
+    robj = self._post(rurl, data)
+    self._invalidate_results(table)
+    if robj.status_code != HTTP_OK:
       raise flaa_error(10, robj.text)
   
-  def count_rows(self, stmt: str) -> int:
+  def _count_rows(self, stmt: str) -> Tuple[int, int]:
     data = {"key-str": self.key_str, "stmt": stmt}
-    try:
-      statements.parse_search_stmt(stmt)
-    except Exception as e:
-      raise flaa_error(12, e.message)
-     
     rurl = self.addr + "count-rows/" + self.proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
-      return int(robj.text.strip())
+    robj = self._post(rurl, data)
+    if robj.status_code == HTTP_OK:
+      return int(robj.text.strip()), len(robj.text)
     else:
       raise flaa_error(10, robj.text)
 
+  @_instrumented
+  def count_rows(self, stmt: Union[str, statements.BoundStmt]) -> int:
+    stmt, table = self._statement(stmt)
+    return self._cached_read("count", stmt, table, lambda: self._count_rows(stmt))
+
+  def query_many(self, queries: Iterable[Tuple[str, str]], concurrency: int = 8) -> List[Any]:
+    # queries are (kind, stmt) pairs where kind is one of "search",
+    # "search_one" or "count". Every statement is validated before any is
+    # sent, then they run concurrently. Results come back in input order with
+    # a flaa_error in place of each query that failed.
+    methods = {"search": self.search, "search_one": self.search_for_one, "count": self.count_rows}
+    items = []
+    for kind, stmt in queries:
+      error = None
+      if kind not in methods:
+        error = flaa_error(12, "The query kind '%s' is not one of 'search', 'search_one' or 'count'." % kind)
+      else:
+        try:
+          self._statement(stmt)
+        except flaa_error as e:
+          error = e
+      items.append((kind, stmt, error))
+
+    def run(item: Tuple[str, str, Optional[flaa_error]]) -> Any:
+      kind, stmt, error = item
+      if error is not None:
+        raise error
+      return methods[kind](stmt)
+
+    return self._fan_out(run, items, concurrency, "query_many")
+
+  def search_many(self, stmts: Iterable[str], concurrency: int = 8) -> List[Any]:
+    return self.query_many([("search", stmt) for stmt in stmts], concurrency)
+
+  def count_many(self, stmts: Iterable[str], concurrency: int = 8) -> List[Any]:
+    return self.query_many([("count", stmt) for stmt in stmts], concurrency)
+
+  @_instrumented
   def all_rows_count(self, table: str) -> int:
+    return self._coalesced((self.proj, "all_rows_count", table), lambda: self._all_rows_count(table))
+
+  def _all_rows_count(self, table: str) -> int:
     data = {"key-str": self.key_str}
     rurl = "%sall-rows-count/%s/%s" % ( self.addr, self.proj, table)
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code == requests.codes.ok:
+    robj = self._post(rurl, data)
+    if robj.status_code == HTTP_OK:
       return int(robj.text.strip())
     else:
       raise flaa_error(10, robj.text)
     
-  def update_rows(self, stmt: str, to_update: Dict[str, any]) -> None:
+  def _update_form(self, stmt: Union[str, statements.BoundStmt], to_update: Dict[str, Any]) -> Tuple[Dict[str, str], str]:
+    stmt, table = self._statement(stmt)
     data = {"key-str": self.key_str, "stmt": stmt}
-    try:
-      statements.parse_search_stmt(stmt)
-    except Exception as e:
-      raise flaa_error(12, e.message)
-       
-    keys = to_update.keys()
-    for i in range(len(keys)):
-      data["set%d_k" % i+1] = keys[i]
-      data["set%d_v" % i+1] = to_update[keys[i]]
-    
+    for i, (key, value) in enumerate(to_update.items(), 1):
+      data["set%d_k" % i] = key
+      data["set%d_v" % i] = value
+    return data, table
+
+  def _update_rows(self, data: Dict[str, str], table: str) -> None:
     rurl = self.addr + "update-rows/" + self.proj
-    robj = requests.post(rurl, data=data, verify=False)
-    if robj.status_code != requests.codes.ok:
+    robj = self._post(rurl, data)
+    self._invalidate_results(table)
+    if robj.status_code != HTTP_OK:
       raise flaa_error(10, robj.text)
+
+  @_instrumented
+  def update_rows(self, stmt: Union[str, statements.BoundStmt], to_update: Dict[str, Any]) -> None:
+    self._update_rows(*self._update_form(stmt, to_update))
+
+  def update_rows_many(self, updates: Iterable[Tuple[str, Dict[str, Any]]], concurrency: int = 8) -> List[Optional[flaa_error]]:
+    # updates are (stmt, to_update) pairs. Every statement is validated and
+    # its form built before any is sent, then they run concurrently. Returns
+    # None for each update that succeeded and the flaa_error of each that
+    # failed, in input order.
+    items = []
+    for stmt, to_update in updates:
+      try:
+        items.append(self._update_form(stmt, to_update))
+      except flaa_error as e:
+        items.append(e)
+
+    def run(item: Union[Tuple[Dict[str, str], str], flaa_error]) -> None:
+      if isinstance(item, flaa_error):
+        raise item
+      self._update_rows(*item)
+
+    return self._fan_out(run, items, concurrency, "update_rows_many")
       
\ No newline at end of file
@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+from . import flaacl, flaa_error
+from . import transfer
+
+
+def _progress(verb: str):
+  def show(rows: int, seconds: float) -> None:
+    rate = rows / seconds if seconds > 0 else 0.0
+    sys.stderr.write("\r%s %d rows (%.0f rows/s)" % (verb, rows, rate))
+    sys.stderr.flush()
+  return show
+
+
+def main(argv=None) -> int:
+  parser = argparse.ArgumentParser(prog="python -m pyflaarum", description="Export and import flaarum tables.")
+  parser.add_argument("--ip", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=22318)
+  parser.add_argument("--key", default=os.environ.get("FLAARUM_KEY", ""),
+    help="the key string of the server (defaults to $FLAARUM_KEY)")
+  parser.add_argument("--proj", required=True)
+  parser.add_argument("--quiet", action="store_true", help="do not show progress")
+  commands = parser.add_subparsers(dest="command", required=True)
+
+  export = commands.add_parser("export", help="write a table to an NDJSON or CSV file")
+  export.add_argument("table")
+  export.add_argument("path", help="the file to write, '-' for stdout")
+  export.add_argument("--format", choices=transfer.FORMATS, help="defaults to csv for .csv files, else ndjson")
+  export.add_argument("--page-size", type=int, default=1000)
+  export.add_argument("--checkpoint", help="a file to save progress to and resume from")
+
+  imp = commands.add_parser("import", help="insert the rows of an NDJSON or CSV file into a table")
+  imp.add_argument("table")
+  imp.add_argument("path", help="the file to read, '-' for stdin")
+  imp.add_argument("--format", choices=transfer.FORMATS, help="defaults to csv for .csv files, else ndjson")
+  imp.add_argument("--concurrency", type=int, default=8)
+  imp.add_argument("--queue-size", type=int, default=64, help="rows read ahead of the inserts")
+  imp.add_argument("--checkpoint", help="a file to save progress to and resume from")
+  imp.add_argument("--errors", help="a file to write the rows that failed to, as NDJSON")
+
+  args = parser.parse_args(argv)
+  cl = flaacl(args.ip, args.key, args.proj, port=args.port,
+    pool_size=getattr(args, "concurrency", 1))
+  try:
+    if args.command == "export":
+      transfer.export_table(cl, args.table, args.path, args.format, args.page_size, args.checkpoint,
+        None if args.quiet else _progress("exported"))
+      if not args.quiet:
+        sys.stderr.write("\n")
+    else:
+      report = transfer.import_table(cl, args.table, args.path, args.format, args.concurrency, args.queue_size,
+        args.checkpoint, errors_path=args.errors, progress=None if args.quiet else _progress("imported"))
+      if not args.quiet:
+        sys.stderr.write("\n%d inserted, %d failed in %.1fs\n" % (report["inserted"], report["errors"], report["seconds"]))
+      if report["errors"]:
+        return 1
+  except flaa_error as e:
+    sys.stderr.write("\nerror %d: %s\n" % (e.code, e.msg))
+    return 2
+  finally:
+    cl.close()
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,269 @@
+import asyncio
+import json
+from . import statements
+from . import objects
+from . import validation
+from .errors import flaa_error
+from .transport import Response
+from .cache import SchemaCache
+from typing import Any, Callable, Dict, List, Optional
+
+
+class aflaacl:
+  # The asyncio counterpart of flaacl. Requests go over one pooled aiohttp
+  # session, and at most 'max_in_flight' of them run at a time no matter how
+  # many coroutines share the client.
+  def __init__(self, ip: str, key_str: str, proj: str, port=22318, pool_size: int = 10,
+      keep_alive: bool = True, timeout: Optional[float] = None, max_in_flight: int = 100,
+      schema_ttl: Optional[float] = 60.0):
+    self.ip = ip
+    self.key_str = key_str
+    self.proj = proj
+    self.port = port
+    self.addr = "https://" + self.ip + ":" + str(self.port) + "/"
+    self.pool_size = pool_size
+    self.keep_alive = keep_alive
+    self.timeout = timeout
+    self.max_in_flight = max_in_flight
+    self.schema_cache = SchemaCache(ttl=schema_ttl)
+    self._validators = {}
+    self._session = None
+    self._in_flight = None
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, exc_type, exc_value, traceback):
+    await self.close()
+
+  async def close(self) -> None:
+    if self._session is not None:
+      await self._session.close()
+      self._session = None
+
+  def _get_session(self):
+    if self._session is None:
+      try:
+        import aiohttp
+      except ImportError:
+        raise ImportError("aflaacl needs the 'aiohttp' package. Install it with 'pip install pyflaarum[async]'.")
+
+      connector = aiohttp.TCPConnector(limit=self.pool_size, ssl=False, force_close=not self.keep_alive)
+      self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+      self._in_flight = asyncio.Semaphore(self.max_in_flight)
+    return self._session
+
+  async def _post(self, rurl: str, data: Dict[str, str]) -> Response:
+    import aiohttp
+
+    session = self._get_session()
+    async with self._in_flight:
+      try:
+        async with session.post(rurl, data=data) as robj:
+          return Response(robj.status, await robj.text())
+      except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise flaa_error(11, str(e) or e.__class__.__name__)
+
+  def _invalidate_schema(self, stmt: str) -> None:
+    try:
+      table_name = statements.parse_table_structure_stmt(stmt).table_name
+    except Exception:
+      self.schema_cache.invalidate(self.proj)
+    else:
+      self.schema_cache.invalidate(self.proj, table_name)
+
+  def _validate_search(self, stmt: str) -> None:
+    try:
+      statements.parse_search_stmt(stmt)
+    except Exception as e:
+      raise flaa_error(12, str(e))
+
+  async def ping(self) -> None:
+    data = {"key-str": self.key_str}
+    robj = await self._post(self.addr + "is-flaarum", data)
+
+    if robj.status_code != 200:
+      raise flaa_error(10, "Unexpected Error in confirming that the server is a flaarum store.")
+
+  async def create_project(self, proj: str) -> None:
+    data = {"key-str": self.key_str}
+    robj = await self._post(self.addr + "create-project/" + proj, data)
+    if robj.status_code != 200:
+      raise flaa_error(10, robj.text)
+
+  async def delete_project(self, proj: str) -> None:
+    data = {"key-str": self.key_str}
+    robj = await self._post(self.addr + "delete-project/" + proj, data)
+    if robj.status_code != 200:
+      raise flaa_error(10, robj.text)
+
+  async def list_projects(self):
+    data = {"key-str": self.key_str}
+    robj = await self._post(self.addr + "list-projects", data)
+    if robj.status_code == 200:
+      return json.loads(robj.text)
+    else:
+      raise flaa_error(11, robj.text)
+
+  async def rename_project(self, proj: str, new_proj: str):
+    data = {"key-str": self.key_str}
+    robj = await self._post(self.addr + "rename-project/" + proj + "/" + new_proj, data)
+    if robj.status_code != 200:
+      raise flaa_error(11, robj.text)
+
+  async def create_table(self, stmt: str):
+    data = {"key-str": self.key_str, "stmt": stmt}
+    robj = await self._post(self.addr + "create-table/" + self.proj, data)
+    self._invalidate_schema(stmt)
+    if robj.status_code != 200:
+      raise flaa_error(11, robj.text)
+
+  async def update_table_structure(self, stmt: str):
+    data = {"key-str": self.key_str, "stmt": stmt}
+    robj = await self._post(self.addr + "update-table-structure/" + self.proj, data)
+    self._invalidate_schema(stmt)
+    if robj.status_code != 200:
+      raise flaa_error(11, robj.text)
+
+  async def list_tables(self):
+    data = {"key-str": self.key_str}
+    robj = await self._post(self.addr + "list-tables/" + self.proj, data)
+    if robj.status_code == 200:
+      return json.loads(robj.text)
+    else:
+      raise flaa_error(11, robj.text)
+
+  async def current_table_version_num(self, table: str) -> int:
+    data = {"key-str": self.key_str}
+    rurl = "%sget-current-version-num/%s/%s" % (self.addr, self.proj, table)
+    robj = await self._post(rurl, data)
+    if robj.status_code == 200:
+      return int(robj.text.strip())
+    else:
+      raise flaa_error(11, robj.text)
+
+  async def table_structure(self, table: str, version: int) -> str:
+    data = {"key-str": self.key_str}
+    rurl = "%sget-table-structure/%s/%s/%d" % (self.addr, self.proj, table, version)
+    robj = await self._post(rurl, data)
+    if robj.status_code == 200:
+      return robj.text
+    else:
+      raise flaa_error(11, robj.text)
+
+  async def table_structure_parsed(self, table: str, version: int) -> objects.Table:
+    stmt = await self.table_structure(table, version)
+    return statements.parse_table_structure_stmt(stmt)
+
+  async def current_table_structure_parsed(self, table: str) -> objects.Table:
+    version = await self.current_table_version_num(table)
+    stmt = await self.table_structure(table, version)
+    table_obj = statements.parse_table_structure_stmt(stmt)
+    self.schema_cache.put(self.proj, table, table_obj, version)
+    return table_obj
+
+  async def cached_table_structure_parsed(self, table: str) -> objects.Table:
+    entry = self.schema_cache.get(self.proj, table)
+    if entry is not None:
+      return entry[0]
+    return await self.current_table_structure_parsed(table)
+
+  async def create_or_update_table(self, stmt: str) -> None:
+    tables = await self.list_tables()
+    table_obj = statements.parse_table_structure_stmt(stmt)
+    if not table_obj.table_name in tables:
+      await self.create_table(stmt)
+    else:
+      version = await self.current_table_version_num(table_obj.table_name)
+      old_stmt = await self.table_structure(table_obj.table_name, version)
+      if old_stmt != statements.format_table_obj(table_obj):
+        await self.update_table_structure(stmt)
+
+  async def delete_table(self, table: str) -> None:
+    data = {"key-str": self.key_str}
+    robj = await self._post(self.addr + "delete-table/" + self.proj + "/" + table, data)
+    self.schema_cache.invalidate(self.proj, table)
+    if robj.status_code != 200:
+      raise flaa_error(10, robj.text)
+
+  async def _row_validator(self, table: str) -> Callable[[dict], dict]:
+    table_obj = await self.cached_table_structure_parsed(table)
+    cached = self._validators.get((self.proj, table))
+    if cached is not None and cached[0] is table_obj:
+      return cached[1]
+    validator = validation.compile_row_validator(table_obj)
+    self._validators[(self.proj, table)] = (table_obj, validator)
+    return validator
+
+  async def insert_row(self, table: str, to_insert: dict) -> int:
+    validator = await self._row_validator(table)
+    data = {"key-str": self.key_str}
+    data.update(validator(to_insert))
+
+    rurl = "%sinsert-row/%s/%s" % (self.addr, self.proj, table)
+    robj = await self._post(rurl, data)
+    if robj.status_code == 200:
+      return int(robj.text.strip())
+    elif robj.status_code == 400:
+      if robj.text.strip().startswith("UE:"):
+        raise flaa_error(21, robj.text.strip()[3:])
+      elif robj.text.strip().startswith("FKE:"):
+        raise flaa_error(23, robj.text.strip()[4:])
+      else:
+        raise flaa_error(20, robj.text.strip())
+    else:
+      raise flaa_error(11, robj.text)
+
+  async def search(self, stmt: str) -> List[Dict[str, Any]]:
+    self._validate_search(stmt)
+    data = {"key-str": self.key_str, "stmt": stmt}
+    robj = await self._post(self.addr + "search-table/" + self.proj, data)
+    if robj.status_code == 200:
+      return json.loads(robj.text) or []
+    else:
+      raise flaa_error(11, robj.text)
+
+  async def search_for_one(self, stmt: str) -> Dict[str, Any]:
+    self._validate_search(stmt)
+    data = {"key-str": self.key_str, "stmt": stmt, "query-one": "t"}
+    robj = await self._post(self.addr + "search-table/" + self.proj, data)
+    if robj.status_code == 200:
+      return json.loads(robj.text)
+    else:
+      raise flaa_error(11, robj.text)
+
+  async def delete_rows(self, stmt: str) -> None:
+    self._validate_search(stmt)
+    data = {"key-str": self.key_str, "stmt": stmt}
+    robj = await self._post(self.addr + "delete-rows/" + self.proj, data)
+    if robj.status_code != 200:
+      raise flaa_error(10, robj.text)
+
+  async def count_rows(self, stmt: str) -> int:
+    self._validate_search(stmt)
+    data = {"key-str": self.key_str, "stmt": stmt}
+    robj = await self._post(self.addr + "count-rows/" + self.proj, data)
+    if robj.status_code == 200:
+      return int(robj.text.strip())
+    else:
+      raise flaa_error(10, robj.text)
+
+  async def all_rows_count(self, table: str) -> int:
+    data = {"key-str": self.key_str}
+    rurl = "%sall-rows-count/%s/%s" % (self.addr, self.proj, table)
+    robj = await self._post(rurl, data)
+    if robj.status_code == 200:
+      return int(robj.text.strip())
+    else:
+      raise flaa_error(10, robj.text)
+
+  async def update_rows(self, stmt: str, to_update: Dict[str, Any]) -> None:
+    self._validate_search(stmt)
+    data = {"key-str": self.key_str, "stmt": stmt}
+    for i, (key, value) in enumerate(to_update.items(), 1):
+      data["set%d_k" % i] = key
+      data["set%d_v" % i] = value
+
+    robj = await self._post(self.addr + "update-rows/" + self.proj, data)
+    if robj.status_code != 200:
+      raise flaa_error(10, robj.text)
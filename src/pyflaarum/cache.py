@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+from . import objects
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class SchemaCache:
+  # Parsed table structures and their version numbers keyed by (project, table).
+  def __init__(self, ttl: Optional[float] = 60.0):
+    self.ttl = ttl
+    self._entries: Dict[Tuple[str, str], Tuple[objects.Table, int, float]] = {}
+    self._lock = threading.Lock()
+
+  def get(self, proj: str, table: str) -> Optional[Tuple[objects.Table, int]]:
+    with self._lock:
+      entry = self._entries.get((proj, table))
+      if entry is None:
+        return None
+      table_obj, version, expires = entry
+      if expires and time.monotonic() > expires:
+        del self._entries[(proj, table)]
+        return None
+      return table_obj, version
+
+  def put(self, proj: str, table: str, table_obj: objects.Table, version: int) -> None:
+    table_obj.freeze()
+    expires = time.monotonic() + self.ttl if self.ttl else 0
+    with self._lock:
+      self._entries[(proj, table)] = (table_obj, version, expires)
+
+  def invalidate(self, proj: Optional[str] = None, table: Optional[str] = None) -> None:
+    with self._lock:
+      if proj is None:
+        self._entries.clear()
+      elif table is None:
+        for key in [key for key in self._entries if key[0] == proj]:
+          del self._entries[key]
+      else:
+        self._entries.pop((proj, table), None)
+
+
+class ParseCache:
+  # A bounded LRU of parse results keyed by statement text. Parse failures
+  # are cached as well and raised again on every hit.
+  def __init__(self, parse: Callable[[str], Any], maxsize: int = 512):
+    self.parse = parse
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __call__(self, stmt: str) -> Any:
+    with self._lock:
+      entry = self._entries.get(stmt)
+      if entry is not None:
+        self._entries.move_to_end(stmt)
+        self.hits += 1
+      else:
+        self.misses += 1
+
+    if entry is None:
+      try:
+        entry = (True, self.parse(stmt))
+      except Exception as e:
+        entry = (False, e)
+
+      if self.maxsize > 0:
+        with self._lock:
+          self._entries[stmt] = entry
+          while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    ok, value = entry
+    if not ok:
+      raise value.__class__(*value.args)
+    return value
+
+  def resize(self, maxsize: int) -> None:
+    with self._lock:
+      self.maxsize = maxsize
+      while len(self._entries) > max(maxsize, 0):
+        self._entries.popitem(last=False)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self.hits = 0
+      self.misses = 0
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+class ResultCache:
+  # A read-through cache of query results for flaacl. Entries are keyed by
+  # project, query kind and normalized statement text, evicted in LRU order
+  # once 'max_bytes' of response bodies are held, and expire after the TTL
+  # of their table ('table_ttls' overrides 'ttl' per table; a TTL of 0 turns
+  # caching off for that table). Writes through the client drop the entries
+  # of the written table.
+  def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl: float = 5.0,
+      table_ttls: Optional[Dict[str, float]] = None):
+    self.max_bytes = max_bytes
+    self.ttl = ttl
+    self.table_ttls = dict(table_ttls or {})
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.size = 0
+    self._entries = OrderedDict()
+    self._by_table: Dict[Tuple[str, str], set] = {}
+    self._generations: Dict[Tuple[str, str], int] = {}
+    self._lock = threading.Lock()
+
+  def _remove(self, key) -> None:
+    _, table_key, size, _ = self._entries.pop(key)
+    self.size -= size
+    keys = self._by_table.get(table_key)
+    if keys is not None:
+      keys.discard(key)
+      if not keys:
+        del self._by_table[table_key]
+
+  def get(self, key) -> Tuple[bool, Any]:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and time.monotonic() > entry[3]:
+        self._remove(key)
+        entry = None
+      if entry is None:
+        self.misses += 1
+        return False, None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return True, entry[0]
+
+  def generation(self, proj: str, table: str) -> int:
+    with self._lock:
+      return self._generations.get((proj, table), 0)
+
+  def put(self, key, proj: str, table: str, value: Any, size: int, generation: int) -> None:
+    # generation is what generation() returned before the query was sent. A
+    # write to the table since then means the value may be stale already.
+    ttl = self.table_ttls.get(table, self.ttl)
+    if not ttl or size > self.max_bytes:
+      return
+
+    table_key = (proj, table)
+    with self._lock:
+      if self._generations.get(table_key, 0) != generation:
+        return
+      if key in self._entries:
+        self._remove(key)
+      self._entries[key] = (value, table_key, size, time.monotonic() + ttl)
+      self._by_table.setdefault(table_key, set()).add(key)
+      self.size += size
+      while self.size > self.max_bytes:
+        self._remove(next(iter(self._entries)))
+        self.evictions += 1
+
+  def invalidate(self, proj: str, table: str) -> None:
+    table_key = (proj, table)
+    with self._lock:
+      self._generations[table_key] = self._generations.get(table_key, 0) + 1
+      for key in list(self._by_table.get(table_key, ())):
+        self._remove(key)
+
+  def clear(self) -> None:
+    with self._lock:
+      self._entries.clear()
+      self._by_table.clear()
+      self.size = 0
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+        "entries": len(self._entries), "bytes": self.size}
@@ -0,0 +1,156 @@
+import bisect
+import threading
+from . import flaacl
+from .errors import flaa_error
+from .transport import HTTPTransport
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+NodeAddr = Union[str, Tuple[str, int]]
+
+
+def _parse_addr(addr: NodeAddr) -> Tuple[str, int]:
+  if isinstance(addr, tuple):
+    return addr[0], int(addr[1])
+  host, sep, port = addr.rpartition(":")
+  if not sep:
+    return addr, 22318
+  return host, int(port)
+
+
+def _hash(text: str) -> int:
+  import hashlib
+
+  return int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:8], "big")
+
+
+class _Node:
+  def __init__(self, ip: str, port: int, transport, health_transport):
+    self.ip = ip
+    self.port = port
+    self.name = "%s:%d" % (ip, port)
+    self.transport = transport
+    # pings open a connection of their own, so they are not stuck behind the
+    # requests of a node that hangs, and find a node that stopped listening.
+    self.health_transport = health_transport
+    self.healthy = True
+
+
+class flaacluster:
+  # Spreads projects over several flaarum servers. A project goes to the node
+  # given for it in 'mapping' (a node or a list of nodes in order of
+  # preference), and otherwise to its node on a consistent hash ring of the
+  # project names, so adding a node only moves the projects that land on it.
+  #
+  # Every node has its own transport and so its own connection pool. When
+  # health_interval is set, a background thread pings every node that often
+  # and takes the nodes that fail out of rotation until they answer again.
+  # While the node of a project is out, its requests fail with error 11. With
+  # failover, a project mapped to several nodes goes to the next healthy one
+  # of them instead, so only list nodes that hold copies of the project.
+  #
+  # client(proj) returns a flaacl for the project on its current node. Other
+  # keyword arguments are passed on to every flaacl.
+  def __init__(self, nodes: Iterable[NodeAddr], key_str: str, mapping: Optional[Dict[str, Union[NodeAddr, Sequence[NodeAddr]]]] = None,
+      replicas: int = 100, health_interval: Optional[float] = 5.0, health_timeout: float = 2.0,
+      pool_size: int = 10, keep_alive: bool = True, failover: bool = False, **client_kwargs):
+    self.key_str = key_str
+    self.client_kwargs = client_kwargs
+    self.nodes: Dict[str, _Node] = {}
+    for addr in nodes:
+      ip, port = _parse_addr(addr)
+      node = _Node(ip, port, HTTPTransport(pool_size=pool_size, keep_alive=keep_alive),
+        HTTPTransport(pool_size=1, keep_alive=False))
+      self.nodes[node.name] = node
+    if not self.nodes:
+      raise flaa_error(12, "A cluster needs at least one node.")
+
+    self.mapping: Dict[str, List[str]] = {}
+    for proj, addrs in (mapping or {}).items():
+      if isinstance(addrs, (str, tuple)):
+        addrs = [addrs]
+      names = ["%s:%d" % _parse_addr(addr) for addr in addrs]
+      for name in names:
+        if name not in self.nodes:
+          raise flaa_error(12, "The project '%s' is mapped to '%s', which is not a node of the cluster." % (proj, name))
+      self.mapping[proj] = names
+
+    ring = sorted((_hash("%s#%d" % (name, i)), name) for name in self.nodes for i in range(replicas))
+    self._ring_keys = [key for key, _ in ring]
+    self._ring_names = [name for _, name in ring]
+
+    self.health_timeout = health_timeout
+    self.failover = failover
+    self._clients: Dict[Tuple[str, str], flaacl] = {}
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._health_thread = None
+    if health_interval:
+      self._health_thread = threading.Thread(target=self._health_loop, args=(health_interval,),
+        name="pyflaarum-health", daemon=True)
+      self._health_thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self) -> None:
+    self._stop.set()
+    if self._health_thread is not None:
+      self._health_thread.join()
+    for node in self.nodes.values():
+      node.transport.close()
+      node.health_transport.close()
+
+  def _candidates(self, proj: str) -> List[str]:
+    # The nodes holding proj in order of preference.
+    if proj in self.mapping:
+      return self.mapping[proj]
+    start = bisect.bisect(self._ring_keys, _hash(proj))
+    return [self._ring_names[start % len(self._ring_names)]]
+
+  def node_for(self, proj: str) -> str:
+    # The name ('ip:port') of the node proj is sent to now.
+    candidates = self._candidates(proj)
+    if not self.failover:
+      candidates = candidates[:1]
+    for name in candidates:
+      if self.nodes[name].healthy:
+        return name
+    raise flaa_error(11, "The node of the project '%s' is down." % proj)
+
+  def client(self, proj: str) -> flaacl:
+    node = self.nodes[self.node_for(proj)]
+    key = (node.name, proj)
+    cl = self._clients.get(key)
+    if cl is None:
+      with self._lock:
+        cl = self._clients.get(key)
+        if cl is None:
+          cl = self._clients[key] = flaacl(node.ip, self.key_str, proj, port=node.port, transport=node.transport,
+            **self.client_kwargs)
+    return cl
+
+  def check_health(self) -> Dict[str, bool]:
+    # Pings every node now and returns whether each is healthy.
+    for node in self.nodes.values():
+      checker = flaacl(node.ip, self.key_str, "", port=node.port, transport=node.health_transport,
+        timeout=self.health_timeout)
+      try:
+        checker.ping()
+      except flaa_error:
+        node.healthy = False
+      else:
+        node.healthy = True
+    return self.health()
+
+  def health(self) -> Dict[str, bool]:
+    return {name: node.healthy for name, node in self.nodes.items()}
+
+  def _health_loop(self, interval: float) -> None:
+    while not self._stop.wait(interval):
+      try:
+        self.check_health()
+      except Exception:
+        pass
@@ -0,0 +1,127 @@
+import codecs
+import json
+from array import array
+from . import objects
+from .validation import GENERATED_FIELDS
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Union
+
+
+def compile_row_decoder(table_obj: objects.Table) -> Callable[[dict], dict]:
+  # Returns a function that turns the 'int' fields of a row (and the
+  # generated 'id' and '_version') into ints in place.
+  int_fields = GENERATED_FIELDS + tuple(field_obj.field_name for field_obj in table_obj.fields if field_obj.field_type == "int")
+
+  def decode(row: dict) -> dict:
+    for field_name in int_fields:
+      v = row.get(field_name)
+      if v is None or type(v) is int:
+        continue
+      try:
+        row[field_name] = int(v)
+      except (TypeError, ValueError):
+        pass
+    return row
+
+  return decode
+
+
+def to_columns(rows: List[dict], table_obj: objects.Table) -> Dict[str, Union[array, List[Any]]]:
+  # Turns decoded rows into a dict of column name to values. 'int' columns
+  # are packed into array('q') unless a row lacks the value.
+  int_fields = set(GENERATED_FIELDS)
+  int_fields.update(field_obj.field_name for field_obj in table_obj.fields if field_obj.field_type == "int")
+
+  names = {}
+  for row in rows:
+    for name in row:
+      names[name] = None
+
+  columns = {}
+  for name in names:
+    values = [row.get(name) for row in rows]
+    if name in int_fields:
+      try:
+        values = array("q", values)
+      except (TypeError, OverflowError):
+        pass
+    columns[name] = values
+
+  return columns
+
+
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+  # Decodes a top level JSON array from a stream of byte chunks and yields
+  # each item as soon as it is complete. Only the undecoded tail of the body
+  # is kept in memory. A 'null' body yields nothing.
+  decoder = json.JSONDecoder()
+  text_decoder = codecs.getincrementaldecoder("utf-8")()
+  chunks = iter(chunks)
+  buf = ""
+  pos = 0
+  eof = False
+
+  def more() -> bool:
+    nonlocal buf, pos, eof
+    if eof:
+      return False
+    for chunk in chunks:
+      text = text_decoder.decode(chunk)
+      if text:
+        buf = buf[pos:] + text
+        pos = 0
+        return True
+    buf = buf[pos:] + text_decoder.decode(b"", final=True)
+    pos = 0
+    eof = True
+    return False
+
+  def next_char() -> str:
+    nonlocal pos
+    while True:
+      while pos < len(buf) and buf[pos] in _WHITESPACE:
+        pos += 1
+      if pos < len(buf):
+        return buf[pos]
+      if not more():
+        raise ValueError("The response ended before the JSON array was complete.")
+
+  first = next_char()
+  if first == "n":
+    while more():
+      pass
+    if json.loads(buf[pos:]) is not None:
+      raise ValueError("The response is not a JSON array.")
+    return
+  if first != "[":
+    raise ValueError("The response is not a JSON array.")
+  pos += 1
+
+  expect_comma = False
+  while True:
+    ch = next_char()
+    if ch == "]":
+      return
+    if expect_comma:
+      if ch != ",":
+        raise ValueError("Expected ',' or ']' at position %d of the JSON array." % pos)
+      pos += 1
+      next_char()
+
+    while True:
+      try:
+        item, end = decoder.raw_decode(buf, pos)
+      except json.JSONDecodeError:
+        if not more():
+          raise
+        continue
+      # a number could continue in the next chunk.
+      if end == len(buf) and more():
+        continue
+      break
+
+    pos = end
+    expect_comma = True
+    yield item
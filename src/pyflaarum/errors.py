@@ -0,0 +1,5 @@
+class flaa_error(Exception):
+  def __init__(self, code: int, msg: str):
+    self.msg = msg
+    self.code = code
+    self.message = "Error Code: " + str(code) + "\n" + msg
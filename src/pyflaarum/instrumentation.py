@@ -0,0 +1,159 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence
+
+
+class CallEvent:
+  # What a hook gets for every request a flaacl makes. network_seconds is the
+  # time inside the transport, parse_seconds the time spent parsing and
+  # validating statements or rows before the request. status_code is 0 and
+  # the sizes are 0 when no response came back. A call that failed before
+  # sending anything (a bad statement for instance) gets an event with an
+  # empty path.
+  __slots__ = ("method", "path", "project", "table", "parse_seconds", "network_seconds",
+    "request_bytes", "response_bytes", "status_code", "error_code")
+
+  def __init__(self, method: str, path: str, project: str, table: str = "", parse_seconds: float = 0.0,
+      network_seconds: float = 0.0, request_bytes: int = 0, response_bytes: int = 0, status_code: int = 0,
+      error_code: Optional[int] = None):
+    self.method = method
+    self.path = path
+    self.project = project
+    self.table = table
+    self.parse_seconds = parse_seconds
+    self.network_seconds = network_seconds
+    self.request_bytes = request_bytes
+    self.response_bytes = response_bytes
+    self.status_code = status_code
+    self.error_code = error_code
+
+  def __repr__(self):
+    args = ", ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__)
+    return "CallEvent(%s)" % args
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+  def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+    self.buckets = tuple(buckets)
+    self.counts = [0] * (len(self.buckets) + 1)
+    self.count = 0
+    self.total = 0.0
+
+  def observe(self, value: float) -> None:
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.count += 1
+    self.total += value
+
+  def quantile(self, q: float) -> float:
+    # The upper bound of the bucket holding the q-th value.
+    if not self.count:
+      return 0.0
+    rank = q * self.count
+    seen = 0
+    for i, count in enumerate(self.counts):
+      seen += count
+      if seen >= rank and count:
+        return self.buckets[i] if i < len(self.buckets) else float("inf")
+    return float("inf")
+
+  def snapshot(self) -> dict:
+    return {
+      "count": self.count,
+      "sum": self.total,
+      "mean": self.total / self.count if self.count else 0.0,
+      "p50": self.quantile(0.5),
+      "p90": self.quantile(0.9),
+      "p99": self.quantile(0.99),
+      "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+    }
+
+
+class _MethodMetrics:
+  def __init__(self, buckets: Sequence[float]):
+    self.count = 0
+    self.errors: Dict[int, int] = {}
+    self.statuses: Dict[int, int] = {}
+    self.request_bytes = 0
+    self.response_bytes = 0
+    self.network = Histogram(buckets)
+    self.parse = Histogram(buckets)
+
+
+class MetricsAggregator:
+  # An in-memory hook: register it with flaacl.add_hook to get counts,
+  # error codes, byte totals and latency histograms per method.
+  def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+    self.buckets = tuple(buckets)
+    self._methods: Dict[str, _MethodMetrics] = {}
+    self._lock = threading.Lock()
+
+  def __call__(self, event: CallEvent) -> None:
+    with self._lock:
+      metrics = self._methods.get(event.method)
+      if metrics is None:
+        metrics = self._methods[event.method] = _MethodMetrics(self.buckets)
+      metrics.count += 1
+      if event.error_code is not None:
+        metrics.errors[event.error_code] = metrics.errors.get(event.error_code, 0) + 1
+      if event.status_code:
+        metrics.statuses[event.status_code] = metrics.statuses.get(event.status_code, 0) + 1
+      metrics.request_bytes += event.request_bytes
+      metrics.response_bytes += event.response_bytes
+      if event.path:
+        metrics.network.observe(event.network_seconds)
+      metrics.parse.observe(event.parse_seconds)
+
+  def snapshot(self) -> Dict[str, dict]:
+    with self._lock:
+      return {method: {
+        "count": metrics.count,
+        "errors": dict(metrics.errors),
+        "statuses": dict(metrics.statuses),
+        "request_bytes": metrics.request_bytes,
+        "response_bytes": metrics.response_bytes,
+        "network_seconds": metrics.network.snapshot(),
+        "parse_seconds": metrics.parse.snapshot(),
+      } for method, metrics in self._methods.items()}
+
+  def reset(self) -> None:
+    with self._lock:
+      self._methods.clear()
+
+
+class _Frame:
+  # The requests of one call of an instrumented method, reported when it
+  # returns. A detached frame only names the method: its requests are
+  # reported one at a time as they are made.
+  __slots__ = ("client", "method", "table", "parse_seconds", "requests", "detached")
+
+  def __init__(self, client, method: str, table: str, detached: bool = False):
+    self.client = client
+    self.method = method
+    self.table = table
+    self.parse_seconds = 0.0
+    self.requests: List[list] = []
+    self.detached = detached
+
+
+_local = threading.local()
+
+
+def current_frame(client) -> Optional[_Frame]:
+  frames = getattr(_local, "frames", None)
+  if frames and frames[-1].client is client:
+    return frames[-1]
+  return None
+
+
+def push_frame(frame: _Frame) -> None:
+  frames = getattr(_local, "frames", None)
+  if frames is None:
+    frames = _local.frames = []
+  frames.append(frame)
+
+
+def pop_frame() -> None:
+  _local.frames.pop()
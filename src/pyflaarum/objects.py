@@ -1,32 +1,131 @@
 from typing import List, Optional
 
-class Field:
-    def __init__(self):
-      pass
 
-class FKey:
-    def __init__(self, field_name: str, pointed_table: str, on_delete: str):
+class _Record:
+    # Base of the slotted model objects. Every attribute has a default, and
+    # freeze() makes an object (and the objects and lists it holds) read-only
+    # and hashable so it can be shared by the caches. freeze() moves an object
+    # to a read-only subclass of its class, so objects that are not frozen
+    # set their attributes as fast as plain slotted objects.
+    __slots__ = ()
+    _frozen = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls._frozen:
+            return
+        cls._fields = cls.__slots__
+        cls._thawed_class = cls
+        cls._frozen_class = type(cls.__name__, (cls,), {
+            "__slots__": (),
+            "__module__": cls.__module__,
+            "_frozen": True,
+            "__setattr__": _read_only,
+            "__delattr__": _read_only,
+            "__hash__": lambda self: hash(self._values()),
+            "__reduce__": lambda self: (_frozen_record, (self._thawed_class, self._values())),
+        })
+
+    def _values(self):
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def freeze(self):
+        if self._frozen:
+            return self
+        for name in self._fields:
+            setattr(self, name, _freeze_value(getattr(self, name)))
+        self.__class__ = self._frozen_class
+        return self
+
+    def __eq__(self, other):
+        if not isinstance(other, _Record) or other._thawed_class is not self._thawed_class:
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __hash__(self):
+        raise TypeError("unhashable type: '%s' (call freeze() first)" % self.__class__.__name__)
+
+    def __repr__(self):
+        args = ", ".join("%s=%r" % (name, getattr(self, name)) for name in self._fields)
+        return "%s(%s)" % (self.__class__.__name__, args)
+
+
+def _read_only(self, *args):
+    raise AttributeError("'%s' object is frozen" % self.__class__.__name__)
+
+
+def _frozen_record(cls, values):
+    # Rebuilds a frozen object when it is unpickled.
+    obj = cls.__new__(cls)
+    for name, value in zip(cls._fields, values):
+        setattr(obj, name, value)
+    return obj.freeze()
+
+
+def _freeze_value(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_value(item) for item in value)
+    if isinstance(value, _Record):
+        return value.freeze()
+    return value
+
+
+class Field(_Record):
+    __slots__ = ("field_name", "field_type", "required", "unique", "not_indexed")
+
+    def __init__(self, field_name: str = "", field_type: str = "", required: bool = False,
+            unique: bool = False, not_indexed: bool = False):
+        self.field_name = field_name
+        self.field_type = field_type  # one of "int", "string", "text"
+        self.required = required
+        self.unique = unique
+        self.not_indexed = not_indexed
+
+class FKey(_Record):
+    __slots__ = ("field_name", "pointed_table", "on_delete")
+
+    def __init__(self, field_name: str = "", pointed_table: str = "", on_delete: str = ""):
         self.field_name = field_name
         self.pointed_table = pointed_table
         self.on_delete = on_delete  # expects one of "on_delete_restrict", "on_delete_delete"
 
-class Table:
-    def __init__(self):
-        pass    
-        # self.table_name = table_name
-        # self.fields = fields
-        # self.foreign_keys = foreign_keys
-
-class Where:
-    # def __init__(self, field_name: str, relation: str, field_value: str, joiner: str, field_values: List[str]):
-    def __init__(self):
-      pass
-        # self.field_name = field_name
-        # self.relation = relation  # eg. '=', '!=', '<', etc.
-        # self.field_value = field_value
-        # self.joiner = joiner  # one of 'and', 'or'
-        # self.field_values = field_values  # for 'in' and 'nin' queries
-
-class Stmt:
-    def __init__(self):
-      pass
\ No newline at end of file
+class Table(_Record):
+    __slots__ = ("table_name", "fields", "foreign_keys")
+
+    def __init__(self, table_name: str = "", fields: Optional[List[Field]] = None,
+            foreign_keys: Optional[List[FKey]] = None):
+        self.table_name = table_name
+        self.fields = fields if fields is not None else []
+        self.foreign_keys = foreign_keys if foreign_keys is not None else []
+
+class Where(_Record):
+    __slots__ = ("field_name", "relation", "field_value", "joiner", "field_values")
+
+    def __init__(self, field_name: str = "", relation: str = "", field_value: str = "",
+            joiner: str = "", field_values: Optional[List[str]] = None):
+        self.field_name = field_name
+        self.relation = relation  # eg. '=', '!=', '<', etc.
+        self.field_value = field_value
+        self.joiner = joiner  # one of '', 'and', 'or'
+        self.field_values = field_values if field_values is not None else []  # for 'in' and 'nin' queries
+
+class Stmt(_Record):
+    __slots__ = ("table", "fields", "expand", "distinct", "start_index", "limit", "order_by",
+        "order_direction", "Multi", "WhereOptions", "MultiWhereOptions", "Joiner")
+
+    def __init__(self, table: str = "", fields: Optional[List[str]] = None, expand: bool = False,
+            distinct: bool = False, start_index: int = 0, limit: int = 0, order_by: str = "",
+            order_direction: str = "", Multi: bool = False, WhereOptions: Optional[List[Where]] = None,
+            MultiWhereOptions: Optional[List[List[Where]]] = None, Joiner: str = ""):
+        self.table = table
+        self.fields = fields if fields is not None else []
+        self.expand = expand
+        self.distinct = distinct
+        self.start_index = start_index
+        self.limit = limit  # 0 means no limit was given
+        self.order_by = order_by
+        self.order_direction = order_direction  # one of '', 'asc', 'desc'
+        self.Multi = Multi
+        self.WhereOptions = WhereOptions if WhereOptions is not None else []
+        self.MultiWhereOptions = MultiWhereOptions if MultiWhereOptions is not None else []
+        self.Joiner = Joiner
@@ -0,0 +1,330 @@
+import heapq
+import threading
+import time
+from collections import deque
+from .transport import TransportError
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class RetryPolicy:
+  # Exponential backoff with full jitter: the wait before retry n is a random
+  # time between 0 and min(max_delay, base_delay * 2**n). Only transport
+  # errors and the statuses in retry_statuses are retried.
+  def __init__(self, attempts: int = 3, base_delay: float = 0.05, max_delay: float = 1.0,
+      retry_statuses: Iterable[int] = (502, 503, 504)):
+    self.attempts = max(1, attempts)
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.retry_statuses = frozenset(retry_statuses)
+
+  def backoff(self, attempt: int) -> float:
+    import random
+
+    return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+  # Opens after failure_threshold failed calls in a row, and then fails calls
+  # straight away for reset_timeout seconds. After that one trial call is let
+  # through: it closes the breaker when it succeeds and opens it again when
+  # it fails.
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half_open"
+
+  def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+    self.failure_threshold = max(1, failure_threshold)
+    self.reset_timeout = reset_timeout
+    self.state = self.CLOSED
+    self.failures = 0
+    self._opened_at = 0.0
+    self._lock = threading.Lock()
+
+  def allow(self) -> bool:
+    with self._lock:
+      if self.state == self.CLOSED:
+        return True
+      if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+        self.state = self.HALF_OPEN
+        return True
+      return False
+
+  def record_success(self) -> None:
+    with self._lock:
+      self.state = self.CLOSED
+      self.failures = 0
+
+  def record_failure(self) -> bool:
+    # Returns True when this failure opened the breaker.
+    with self._lock:
+      self.failures += 1
+      if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        return True
+      return False
+
+
+class _LatencyWindow:
+  # The latencies of the last 'size' successful requests of one endpoint.
+  # The quantile is worked out again only every 'size // 10' new samples.
+  def __init__(self, size: int = 200):
+    self.samples = deque(maxlen=size)
+    self._since_sort = 0
+    self._sorted = []
+    self._lock = threading.Lock()
+
+  def observe(self, seconds: float) -> None:
+    with self._lock:
+      self.samples.append(seconds)
+      self._since_sort += 1
+
+  def quantile(self, q: float, min_samples: int) -> Optional[float]:
+    with self._lock:
+      if len(self.samples) < min_samples:
+        return None
+      if self._since_sort >= max(1, self.samples.maxlen // 10) or not self._sorted:
+        self._sorted = sorted(self.samples)
+        self._since_sort = 0
+      return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+class _Scheduler:
+  # Runs callbacks after a delay on one background thread, so waiting for a
+  # hedge delay does not hold a worker.
+  def __init__(self):
+    self._heap = []
+    self._seq = 0
+    self._cond = threading.Condition()
+    self._thread = None
+    self._closed = False
+
+  def call_later(self, delay: float, fn: Callable[[], None]) -> None:
+    with self._cond:
+      self._seq += 1
+      heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, fn))
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._run, name="pyflaarum-hedge-timer", daemon=True)
+        self._thread.start()
+      self._cond.notify()
+
+  def _run(self) -> None:
+    while True:
+      with self._cond:
+        while not self._closed and not self._heap:
+          self._cond.wait()
+        if self._closed:
+          return
+        when, _, fn = self._heap[0]
+        wait = when - time.monotonic()
+        if wait > 0:
+          self._cond.wait(wait)
+          continue
+        heapq.heappop(self._heap)
+      try:
+        fn()
+      except Exception:
+        pass
+
+  def close(self) -> None:
+    with self._cond:
+      self._closed = True
+      self._cond.notify()
+
+
+class _HedgeState:
+  __slots__ = ("lock", "done", "result", "future")
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.done = False
+    self.result = None
+    self.future = None
+
+
+class Resilience:
+  # Retries, circuit breaking and hedging for the requests of a flaacl. A
+  # Resilience can be shared by many clients: breakers are kept per server
+  # address, and latencies per endpoint.
+  #
+  # Only idempotent reads are retried and hedged. A hedged read is sent on
+  # the caller's thread. When it has not answered after the hedge_quantile
+  # latency of its endpoint, a second copy is sent from a worker, and the
+  # first reply wins: when the copy wins, the first request is aborted
+  # through the transport. At most hedge_budget of the reads are hedged, and
+  # hedging starts once an endpoint has hedge_min_samples latencies.
+  def __init__(self, retry: Optional[RetryPolicy] = None, failure_threshold: int = 5,
+      reset_timeout: float = 10.0, hedge: bool = False, hedge_quantile: float = 0.95,
+      hedge_min_samples: int = 20, hedge_workers: int = 16, hedge_budget: float = 0.05):
+    self.retry = retry if retry is not None else RetryPolicy()
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self.hedge = hedge
+    self.hedge_quantile = hedge_quantile
+    self.hedge_min_samples = hedge_min_samples
+    self.hedge_workers = hedge_workers
+    self.hedge_budget = hedge_budget
+    self._hedge_reads = 0
+    self._hedges_sent = 0
+    self._scheduler = _Scheduler()
+    self._breakers: Dict[str, CircuitBreaker] = {}
+    self._latencies: Dict[str, _LatencyWindow] = {}
+    self._counts = {"retries": 0, "gave_up": 0, "breaker_opened": 0, "breaker_rejected": 0,
+      "hedged": 0, "hedge_wins": 0}
+    self._executor = None
+    self._lock = threading.Lock()
+
+  def breaker(self, addr: str) -> CircuitBreaker:
+    breaker = self._breakers.get(addr)
+    if breaker is None:
+      with self._lock:
+        breaker = self._breakers.setdefault(addr, CircuitBreaker(self.failure_threshold, self.reset_timeout))
+    return breaker
+
+  def _count(self, name: str) -> None:
+    with self._lock:
+      self._counts[name] += 1
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      stats = dict(self._counts)
+      stats["breakers"] = {addr: breaker.state for addr, breaker in self._breakers.items()}
+    return stats
+
+  def _window(self, endpoint: str) -> _LatencyWindow:
+    window = self._latencies.get(endpoint)
+    if window is None:
+      with self._lock:
+        window = self._latencies.setdefault(endpoint, _LatencyWindow())
+    return window
+
+  def _timed(self, endpoint: str, send: Callable[[], Any]) -> Any:
+    start = time.perf_counter()
+    robj = send()
+    self._window(endpoint).observe(time.perf_counter() - start)
+    return robj
+
+  def _take_hedge(self) -> bool:
+    # Hedges are limited to hedge_budget of the hedgeable reads.
+    with self._lock:
+      if self._hedges_sent + 1 > self.hedge_budget * self._hedge_reads:
+        return False
+      self._hedges_sent += 1
+      self._counts["hedged"] += 1
+      return True
+
+  def _hedged(self, endpoint: str, send: Callable[[], Any], abort: Optional[Callable[[int], None]]) -> Any:
+    delay = self._window(endpoint).quantile(self.hedge_quantile, self.hedge_min_samples)
+    with self._lock:
+      self._hedge_reads += 1
+    if delay is None:
+      return self._timed(endpoint, send)
+
+    state = _HedgeState()
+    caller = threading.get_ident()
+
+    def run_hedge() -> None:
+      robj = self._timed(endpoint, send)
+      with state.lock:
+        if state.done:
+          return
+        state.result = robj
+        # the copy won: make the first request give up.
+        if abort is not None:
+          abort(caller)
+
+    def fire() -> None:
+      with state.lock:
+        if state.done or not self._take_hedge():
+          return
+        state.future = self._hedge_executor().submit(run_hedge)
+
+    self._scheduler.call_later(delay, fire)
+    error = None
+    try:
+      robj = self._timed(endpoint, send)
+    except TransportError as e:
+      error = e
+    with state.lock:
+      future = state.future
+      if error is None or future is None:
+        # a copy that answers from now on is dropped.
+        state.done = True
+    if error is None:
+      return robj
+    if future is None:
+      raise error
+
+    # the first request failed, or was aborted because the copy won.
+    try:
+      future.result()
+    except Exception:
+      pass
+    if state.result is None:
+      raise error
+    self._count("hedge_wins")
+    return state.result
+
+  def _hedge_executor(self):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with self._lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix="pyflaarum-hedge")
+      return self._executor
+
+  def call(self, addr: str, endpoint: str, send: Callable[[], Any], idempotent: bool, hedge: bool = True,
+      abort: Optional[Callable[[int], None]] = None) -> Any:
+    # Sends a request through the breaker of addr, retrying and hedging it
+    # when it is idempotent. abort(thread_id) makes the request running on
+    # that thread fail, for hedges that win. Raises TransportError when the
+    # breaker is open or the last attempt failed.
+    breaker = self.breaker(addr)
+    attempts = self.retry.attempts if idempotent else 1
+    hedge = hedge and self.hedge and idempotent
+    error = robj = None
+    for attempt in range(attempts):
+      if attempt:
+        time.sleep(self.retry.backoff(attempt - 1))
+      if not breaker.allow():
+        if not attempt:
+          self._count("breaker_rejected")
+          raise TransportError("The circuit breaker for %s is open." % addr)
+        # other calls opened the breaker meanwhile: give up with this call's
+        # own last error.
+        break
+      if attempt:
+        self._count("retries")
+        if error is None and hasattr(robj, "close"):
+          robj.close()
+
+      error = robj = None
+      try:
+        robj = self._hedged(endpoint, send, abort) if hedge else self._timed(endpoint, send)
+      except TransportError as e:
+        error = e
+      except BaseException:
+        # a half-open breaker must not wait for a trial call that is gone.
+        if breaker.record_failure():
+          self._count("breaker_opened")
+        raise
+      else:
+        if robj.status_code not in self.retry.retry_statuses:
+          breaker.record_success()
+          return robj
+
+    # the breaker counts calls, not attempts, so the retries of one call do
+    # not open it.
+    if breaker.record_failure():
+      self._count("breaker_opened")
+    self._count("gave_up")
+    if error is not None:
+      raise error
+    return robj
+
+  def close(self) -> None:
+    self._scheduler.close()
+    with self._lock:
+      executor, self._executor = self._executor, None
+    if executor is not None:
+      executor.shutdown(wait=False)
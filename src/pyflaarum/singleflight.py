@@ -0,0 +1,52 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+  __slots__ = ("done", "value", "error")
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.value = None
+    self.error = None
+
+
+class SingleFlight:
+  # Runs one call per key at a time. Callers that ask for a key that is
+  # already in flight wait for that call and get its result or error.
+  def __init__(self):
+    self.calls = 0
+    self.coalesced = 0
+    self._in_flight: Dict[Hashable, _Call] = {}
+    self._lock = threading.Lock()
+
+  def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+    with self._lock:
+      self.calls += 1
+      call = self._in_flight.get(key)
+      leader = call is None
+      if leader:
+        call = self._in_flight[key] = _Call()
+      else:
+        self.coalesced += 1
+
+    if not leader:
+      call.done.wait()
+      if call.error is not None:
+        raise call.error
+      return call.value
+
+    try:
+      call.value = fn()
+    except BaseException as e:
+      call.error = e
+      raise
+    finally:
+      with self._lock:
+        del self._in_flight[key]
+      call.done.set()
+    return call.value
+
+  def stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
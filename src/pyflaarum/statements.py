@@ -1,4 +1,5 @@
 from . import objects
+from .cache import ParseCache
 import re
 from typing import List
 
@@ -15,11 +16,10 @@ def parse_table_structure_stmt(stmt: str) -> objects.Table:
   if not stmt.startswith("table:"):
     raise Exception("Bad Statement: structure statements starts with 'table: '")
   
-  ts = objects.Table()
   line1 = stmt.split("\n")[0]
   table_name = line1[len("table:"):].strip()
   name_validate(table_name)
-  ts.table = table_name
+  ts = objects.Table(table_name)
 
   fields_begin_part = stmt.index("fields:")
   if fields_begin_part == -1:
@@ -47,9 +47,7 @@ def parse_table_structure_stmt(stmt: str) -> objects.Table:
     if not parts[1] in ["int", "string", "text"]:
       raise Exception("Bad Statement: the field type '%s' is not allowed in flaarum." % parts[1])
     
-    fs = objects.Field()
-    fs.field_name = parts[0]
-    fs.field_type = parts[1]
+    fs = objects.Field(parts[0], parts[1])
     if len(parts) > 2:
       for other_part in parts[2:] :
         if other_part == "required":
@@ -57,7 +55,7 @@ def parse_table_structure_stmt(stmt: str) -> objects.Table:
         elif other_part == "unique":
           fs.unique = True
         elif other_part == "nindex":
-          fs.nindex = True
+          fs.not_indexed = True
     
     fss.append(fs)
   
@@ -116,40 +114,60 @@ def format_table_obj(table_obj: objects.Table) -> str:
 
 def special_split_line(line: str) -> List[str]:
   line = line.strip()
+  if "'" not in line:
+    return line.split()
+
   splits = []
-  tmp_word = ""
   index = 0
+  length = len(line)
+  while index < length:
+    quote_index = line.find("'", index)
+    if quote_index == -1:
+      splits.extend(line[index:].split())
+      break
+
+    splits.extend(line[index:quote_index].split())
+    end_index = line.find("'", quote_index+1)
+    if end_index == -1:
+      raise ValueError(f"The line \"{line}\" has a quote and no second quote.")
+    splits.append(line[quote_index+1 : end_index])
+    index = end_index + 1
 
-  while index < len(line):
-    ch = line[index]
-    if ch == "'":
-        try:
-          next_quote_index = line[index+1:].index("'")
-          tmpWord = line[index+1 : index+next_quote_index+1]
-          splits.append(tmp_word)
-          tmp_word = ""
-          index += next_quote_index + 2
-          continue
-        except:
-           raise ValueError(f"The line \"{line}\" has a quote and no second quote.")
-        
-    elif ch in (" ", "\t"):
-        if tmp_word:
-            splits.append(tmp_word)
-            tmp_word = ""
-    else:
-        tmp_word += ch
-    index += 1
+  return splits
 
-  if tmp_word:
-      splits.append(tmp_word)
 
-  return splits
+def normalize_stmt(stmt: str) -> str:
+  # Strips every line and drops blank ones, so statements that only differ
+  # in layout compare equal.
+  return "\n".join(part for part in (line.strip() for line in stmt.splitlines()) if part)
+
+
+def set_search_stmt_range(stmt: str, start_index: int, limit: int) -> str:
+  # Rewrites the 'start_index:' and 'limit:' parts of a search statement.
+  # They are placed right after the 'table:' part as anything after 'where:'
+  # belongs to the where section.
+  lines = []
+  for line in stmt.strip().splitlines():
+    part = line.strip()
+    if part.startswith("start_index:") or part.startswith("limit:"):
+      continue
+    lines.append(line)
+    if part.startswith("table:"):
+      lines.append("start_index: %d" % start_index)
+      lines.append("limit: %d" % limit)
+
+  return "\n".join(lines)
+
+
+def parse_where_sub_stmt(where_part: str) -> List[objects.Where]:
+  return _parse_where_lines(where_part.splitlines())
 
 
-def parse_where_sub_stmt(where_part: str) -> objects.Where:
+def _parse_where_lines(lines: List[str]) -> List[objects.Where]:
   where_objs = []
-  for part in where_part.splitlines():
+  found_and = False
+  found_or = False
+  for part in lines:
     part = part.strip()
     if not part:
       continue
@@ -158,46 +176,67 @@ def parse_where_sub_stmt(where_part: str) -> objects.Where:
     if len(parts) < 2:
         raise ValueError(f'The part "{part}" is not up to two words.')
 
+    where_obj = objects.Where()
     if not where_objs:
-        where_obj = objects.Where()
-        where_obj.field_name=parts[0]
-        where_obj.relation=parts[1]
-        if where_obj.relation == "in":
-          where_obj.field_values = parts[2:]
-        else:
-          where_obj.field_value = parts[2]
+      where_obj.joiner = ""
     else:
-      where_obj = objects.Where()
       where_obj.joiner = parts[0]
-      where_obj.field_name=parts[1]
-      where_obj.relation=parts[2]
-      if where_obj.relation == "in":
-        where_obj.field_values = parts[3:]
-      else:
-        where_obj.field_value = parts[3]
-
-    where_objs.append(where_obj)
-
-  found_and = False
-  found_or = False
-  for where_obj in where_objs:
-    if where_obj.joiner == "and":
+      parts = parts[1:]
+      if where_obj.joiner == "and":
         found_and = True
-    if where_obj.joiner == "or":
+      elif where_obj.joiner == "or":
         found_or = True
-
-    if found_and and found_or:
+      if found_and and found_or:
         raise ValueError("Cannot use both 'and' and 'or' in a where section.")
 
+    if len(parts) < 3 and not (len(parts) == 2 and parts[1] == "in"):
+      raise ValueError(f'The part "{part}" has no value to compare with.')
+    where_obj.field_name = parts[0]
+    where_obj.relation = parts[1]
+    if where_obj.relation == "in":
+      where_obj.field_values = parts[2:]
+    else:
+      where_obj.field_value = parts[2]
+
+    where_objs.append(where_obj)
+
   return where_objs
 
 
+_MULTI_WHERE_SECTIONS = ("where1:", "where2:", "where3:", "where4:")
+
+
 def parse_search_stmt(stmt: str) -> objects.Stmt:
-    stmt = stmt.strip()
+  # Parses through search_stmt_cache. The returned Stmt may be shared with
+  # other callers and must not be changed.
+  return search_stmt_cache(stmt)
+
+
+def _parse_search_stmt(stmt: str) -> objects.Stmt:
+    # Reads the statement line by line in a single pass. Header parts are
+    # handled as they come, and the lines of the 'where:' and 'whereN:'
+    # sections are gathered to be split into Where objects afterwards.
     stmt_obj = objects.Stmt()
-    
-    for part in stmt.splitlines():
+    stmt_joiner = None
+    where_lines = None
+    multi_where_lines = {}
+    open_section = None
+
+    for part in stmt.strip().splitlines():
       part = part.strip()
+      if where_lines is not None:
+        where_lines.append(part)
+        continue
+
+      if open_section is not None:
+        end_index = part.find("::")
+        if end_index == -1:
+          open_section.append(part)
+        else:
+          open_section.append(part[:end_index])
+          open_section = None
+        continue
+
       if not part:
           continue
 
@@ -206,12 +245,11 @@ def parse_search_stmt(stmt: str) -> objects.Stmt:
           if not parts:
               raise ValueError("The 'table:' part is required and accepts a table name followed by two optional words")
           stmt_obj.table = parts[0]
-          if len(parts) > 1:
-            for p in parts[1:]:
-              if p == "expand":
-                stmt_obj.expand = True
-              elif p == "distinct":
-                stmt_obj.distinct = True
+          for p in parts[1:]:
+            if p == "expand":
+              stmt_obj.expand = True
+            elif p == "distinct":
+              stmt_obj.distinct = True
       elif part.startswith("fields:"):
         stmt_obj.fields = part[len("fields:"):].split()
       elif part.startswith("start_index:"):
@@ -234,75 +272,204 @@ def parse_search_stmt(stmt: str) -> objects.Stmt:
         if parts[1] not in ["asc", "desc"]:
           raise ValueError(f"The order direction must be either of 'asc' or 'desc'. Instead found '{parts[1]}'")
         stmt_obj.order_direction = parts[1]
-
-    have_multi = "joiner:" in stmt
-    if have_multi:
-      stmt = stmt.strip()
-      stmt_joiner = ""
-      for part in stmt.split('\n'):
-        part = part.strip()
-        if not part:
-          continue
-
-        if part.startswith("joiner:"):
+      elif part.startswith("joiner:"):
+        if stmt_joiner is None:
           opt = part[len("joiner:"):].strip()
           if opt not in ["and", "or"]:
             raise ValueError("joiner only accepts either 'and' or 'or'")
-          else:
-            stmt_joiner = opt
-          break
+          stmt_joiner = opt
+      elif part.startswith("where:"):
+        where_lines = [part[len("where:"):]]
+      elif part[:len("where1:")] in _MULTI_WHERE_SECTIONS:
+        section = part[:len("where1:")]
+        rest = part[len("where1:"):]
+        end_index = rest.find("::")
+        if section in multi_where_lines:
+          # a repeated section is ignored, only its end is looked for.
+          if end_index == -1:
+            open_section = []
+          continue
+        if end_index == -1:
+          open_section = multi_where_lines[section] = [rest]
+        else:
+          multi_where_lines[section] = [rest[:end_index]]
 
-      where_opts = []
-      # where1
-      where1_part_begin = stmt.index("where1:")
-      where1_part_end = stmt[where1_part_begin:].index("::")
-      if where1_part_end == -1:
+    if stmt_joiner is not None:
+      if open_section is not None:
         raise ValueError("Every where section must end with '::'")
-      where1_part = stmt[where1_part_begin+len("where1:"):where1_part_begin+where1_part_end]
-      where1_structs = parse_where_sub_stmt(where1_part)
-      where_opts.append(where1_structs)
-
-      # where2
-      where2_part_begin = stmt.index("where2:")
-      if where2_part_begin == -1:
-        raise ValueError("A statement with 'final_stmt:' must have 'where1:' and 'where2:' sections")
+      if "where1:" not in multi_where_lines or "where2:" not in multi_where_lines:
+        raise ValueError("A statement with 'joiner:' must have 'where1:' and 'where2:' sections")
 
-      where2_part_end = stmt[where2_part_begin:].index("::")
-      if where2_part_end == -1:
-        raise ValueError("Every where section must end with '::'")
-      where2_part = stmt[where2_part_begin+len("where2:"):where2_part_begin+where2_part_end]
-      where2_structs = parse_where_sub_stmt(where2_part)
-      where_opts.append(where2_structs)
-
-      where3_part_begin = stmt.find("where3:")
-      if where3_part_begin != -1:
-        where3_part_end = stmt[where3_part_begin:].index("::")
-        if where3_part_end == -1:
-          raise ValueError("Every where section must end with '::'")
-        where3_part = stmt[where3_part_begin+len("where3:"):where3_part_begin+where3_part_end]
-        where3_structs = parse_where_sub_stmt(where3_part)
-        where_opts.append(where3_structs)
-
-      where4_part_begin = stmt.find("where4:")
-      if where4_part_begin != -1:
-        where4_part_end = stmt[where4_part_begin:].index("::")
-        if where4_part_end == -1:
-          raise ValueError("Every where section must end with '::'")
-        where4_part = stmt[where4_part_begin+len("where4:"):where4_part_begin+where4_part_end]
-        where4_structs = parse_where_sub_stmt(where4_part)
-        where_opts.append(where4_structs)
+      where_opts = []
+      for section in _MULTI_WHERE_SECTIONS:
+        if section in multi_where_lines:
+          where_opts.append(_parse_where_lines(multi_where_lines[section]))
 
       stmt_obj.Multi = True
       stmt_obj.MultiWhereOptions = where_opts
       stmt_obj.Joiner = stmt_joiner
+    elif where_lines is not None:
+      stmt_obj.Multi = False
+      stmt_obj.WhereOptions = _parse_where_lines(where_lines)
 
-    else:
-      where_part_begin = stmt.find("where:")
-      if where_part_begin != -1:
-        where_part = stmt[where_part_begin+len("where:"):]
-        where_objs = parse_where_sub_stmt(where_part)
+    if not stmt_obj.table:
+      raise ValueError("The 'table:' part is required and accepts a table name followed by two optional words")
+    return stmt_obj
 
-        stmt_obj.Multi = False
-        stmt_obj.WhereOptions = where_objs
 
-    return stmt_obj
+search_stmt_cache = ParseCache(lambda stmt: _parse_search_stmt(stmt).freeze())
+
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+_SAMPLE_VALUES = {"value": "x", "values": ["x"], "int": 0, "field": "id", "direction": "asc"}
+
+
+def _quote_value(value, multi: bool) -> str:
+  if isinstance(value, (list, tuple, set, frozenset)):
+    raise ValueError("A list can only be bound to the values of an 'in' or 'nin' where.")
+  value = str(value)
+  if "'" in value or "\n" in value or "\r" in value:
+    raise ValueError(f"The value \"{value}\" can't be quoted: it has a quote or a line break.")
+  if multi and "::" in value:
+    raise ValueError(f"The value \"{value}\" can't be used in a 'whereN:' section: it has '::'.")
+  return "'" + value + "'"
+
+
+def _render_int(value) -> str:
+  if isinstance(value, bool):
+    raise ValueError(f"The value '{value}' is not a number.")
+  try:
+    return str(int(value))
+  except (TypeError, ValueError):
+    raise ValueError(f"The value '{value}' is not a number.")
+
+
+def _render_field(value) -> str:
+  value = str(value)
+  if not value or "'" in value:
+    raise ValueError(f"The value '{value}' is not a field name.")
+  return name_validate(value)
+
+
+def _render_direction(value) -> str:
+  if value not in ("asc", "desc"):
+    raise ValueError(f"The order direction must be either of 'asc' or 'desc'. Instead found '{value}'")
+  return value
+
+
+class BoundStmt:
+  # A search statement rendered from a PreparedStmt. flaacl methods that take
+  # a search statement take it in place of a string and skip parsing it.
+  __slots__ = ("stmt", "table")
+
+  def __init__(self, stmt: str, table: str):
+    self.stmt = stmt
+    self.table = table
+
+  def __str__(self):
+    return self.stmt
+
+  def __repr__(self):
+    return "BoundStmt(%r)" % self.stmt
+
+
+class PreparedStmt:
+  # A search statement with {name} placeholders, checked once. Placeholders
+  # stand for values in the 'where:' and 'whereN:' sections (a list after
+  # 'in' or 'nin'), the numbers of 'limit:' and 'start_index:', and the words
+  # of 'order_by:'. They must be whole words. bind() quotes the values and
+  # fills them in.
+  def __init__(self, template: str):
+    self.template = template
+    self._pieces = []
+    self._slots = []
+    kinds = {}
+
+    open_section = None
+    for line in template.strip().splitlines():
+      part = line.strip()
+      # the section of this line, tracked the way _parse_search_stmt does.
+      if open_section == "where":
+        section = "where"
+      elif open_section == "multi":
+        section = "multi"
+        if "::" in part:
+          open_section = None
+      elif part.startswith("where:"):
+        section = open_section = "where"
+      elif part[:len("where1:")] in _MULTI_WHERE_SECTIONS:
+        section = "multi"
+        if "::" not in part[len("where1:"):]:
+          open_section = "multi"
+      else:
+        section = part.split(":", 1)[0]
+
+      index = 0
+      for match in _PLACEHOLDER.finditer(line):
+        start, end = match.span()
+        if (start and not line[start-1].isspace()) or not (end == len(line) or line[end].isspace()
+            or line.startswith("::", end)):
+          raise ValueError(f"The placeholder '{match.group()}' must be a whole word.")
+
+        before = line[:start].split()
+        if section in ("where", "multi"):
+          kind = "values" if before and before[-1] in ("in", "nin") else "value"
+        elif section in ("limit", "start_index") and line[end:].strip() == "" and len(before) == 1:
+          kind = "int"
+        elif section == "order_by" and len(before) in (1, 2):
+          kind = "field" if len(before) == 1 else "direction"
+        else:
+          raise ValueError(f"The placeholder '{match.group()}' is not in a where section, 'limit:', "
+            "'start_index:' or 'order_by:'.")
+
+        name = match.group(1)
+        if kinds.setdefault(name, kind) != kind:
+          raise ValueError(f"The placeholder '{match.group()}' is used for different kinds of values.")
+        self._pieces.append(line[index:start])
+        self._slots.append((len(self._pieces), name, kind, section == "multi"))
+        self._pieces.append("")
+        index = end
+      self._pieces.append(line[index:] + "\n")
+
+    self.names = frozenset(kinds)
+    sample = self._render({name: _SAMPLE_VALUES[kind] for name, kind in kinds.items()})
+    self.table = _parse_search_stmt(sample).table
+
+  def _render(self, values: dict) -> str:
+    pieces = list(self._pieces)
+    for index, name, kind, multi in self._slots:
+      value = values[name]
+      if kind == "value":
+        pieces[index] = _quote_value(value, multi)
+      elif kind == "values":
+        if not isinstance(value, (list, tuple, set, frozenset)):
+          value = [value]
+        pieces[index] = " ".join(_quote_value(v, multi) for v in value)
+      elif kind == "int":
+        pieces[index] = _render_int(value)
+      elif kind == "field":
+        pieces[index] = _render_field(value)
+      else:
+        pieces[index] = _render_direction(value)
+    return "".join(pieces)
+
+  def bind(self, **values) -> BoundStmt:
+    missing = self.names.difference(values)
+    if missing:
+      raise ValueError("No value was given for %s." % ", ".join("'{%s}'" % name for name in sorted(missing)))
+    extra = set(values).difference(self.names)
+    if extra:
+      raise ValueError("The statement has no placeholder %s." % ", ".join("'{%s}'" % name for name in sorted(extra)))
+    return BoundStmt(self._render(values), self.table)
+
+  def __repr__(self):
+    return "PreparedStmt(%r)" % self.template
+
+
+prepared_stmt_cache = ParseCache(PreparedStmt, maxsize=128)
+
+
+def prepare(template: str) -> PreparedStmt:
+  # Prepared statements are cached by template text, so calling prepare for
+  # every request is cheap.
+  return prepared_stmt_cache(template)
@@ -0,0 +1,226 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from . import flaacl
+from .errors import flaa_error
+from .validation import GENERATED_FIELDS
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# Moves whole tables in and out of flaarum as NDJSON (one JSON object per
+# line) or CSV without holding them in memory. Both directions can save a
+# checkpoint file as they go and pick up from it when run again with the
+# same file. Rows keep their data but not their ids: inserting a row always
+# gives it a new id.
+
+FORMATS = ("ndjson", "csv")
+
+
+def guess_format(path: str) -> str:
+  return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def _load_checkpoint(path: Optional[str], table: str, fmt: str) -> Dict[str, Any]:
+  if path is None or not os.path.exists(path):
+    return {}
+  with open(path) as f:
+    state = json.load(f)
+  if state.get("table") != table or state.get("format") != fmt:
+    raise flaa_error(12, "The checkpoint '%s' is for table '%s' (%s), not '%s' (%s)."
+      % (path, state.get("table"), state.get("format"), table, fmt))
+  return state
+
+
+def _save_checkpoint(path: Optional[str], state: Dict[str, Any]) -> None:
+  if path is None:
+    return
+  tmp_path = path + ".tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(state, f)
+  os.replace(tmp_path, path)
+
+
+def export_table(cl: flaacl, table: str, path: str, fmt: Optional[str] = None, page_size: int = 1000,
+    checkpoint: Optional[str] = None, progress: Optional[Callable[[int, float], None]] = None) -> int:
+  # Writes the rows of table to path ('-' for stdout) a page at a time,
+  # reading pages with start_index/limit statements. After every page the
+  # file is flushed and the checkpoint saved, so a run that stops can be
+  # resumed from the last whole page. progress is called with the number of
+  # rows written and the seconds taken. Returns the number of rows written.
+  fmt = fmt or guess_format(path)
+  if fmt not in FORMATS:
+    raise flaa_error(12, "The format '%s' is not one of %s." % (fmt, ", ".join(FORMATS)))
+  state = _load_checkpoint(checkpoint, table, fmt) if path != "-" else {}
+  rows_done = state.get("rows", 0)
+
+  columns = None
+  if fmt == "csv":
+    table_obj = cl.cached_table_structure_parsed(table)
+    columns = list(GENERATED_FIELDS) + [field_obj.field_name for field_obj in table_obj.fields]
+
+  if path == "-":
+    out = sys.stdout.buffer
+  elif state:
+    out = open(path, "r+b")
+    out.truncate(state["offset"])
+    out.seek(state["offset"])
+  else:
+    out = open(path, "wb")
+
+  start = time.perf_counter()
+  buf = io.StringIO()
+  writer = None
+  if fmt == "csv":
+    writer = csv.DictWriter(buf, columns, extrasaction="ignore", lineterminator="\n")
+    if not state:
+      writer.writeheader()
+
+  def flush() -> None:
+    out.write(buf.getvalue().encode("utf-8"))
+    out.flush()
+    buf.seek(0)
+    buf.truncate()
+    if path != "-":
+      _save_checkpoint(checkpoint, {"table": table, "format": fmt, "rows": rows_done, "offset": out.tell()})
+    if progress is not None:
+      progress(rows_done, time.perf_counter() - start)
+
+  try:
+    stmt = "table: %s\nstart_index: %d" % (table, rows_done)
+    in_page = 0
+    for row in cl.search_iter(stmt, page_size=page_size):
+      if writer is not None:
+        writer.writerow(row)
+      else:
+        buf.write(json.dumps(row, ensure_ascii=False))
+        buf.write("\n")
+      rows_done += 1
+      in_page += 1
+      if in_page == page_size:
+        flush()
+        in_page = 0
+    flush()
+  finally:
+    if out is not sys.stdout.buffer:
+      out.close()
+
+  return rows_done
+
+
+class _BadLine:
+  # Stands in for an NDJSON line that is not a JSON object.
+  def __init__(self, text: str, error: flaa_error):
+    self.text = text
+    self.error = error
+
+
+def _read_rows(path: str, fmt: str) -> Iterator[Any]:
+  # Yields the rows of the file, with a _BadLine in place of every line that
+  # cannot be read as a row, so one bad line does not stop an import.
+  f = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+  try:
+    if fmt == "csv":
+      for row in csv.DictReader(f):
+        # an empty cell is a value that was not set.
+        yield {key: value for key, value in row.items() if value != ""}
+    else:
+      for line in f:
+        if not line.strip():
+          continue
+        try:
+          row = json.loads(line)
+        except ValueError as e:
+          yield _BadLine(line.rstrip("\r\n"), flaa_error(12, "The line is not valid JSON: %s" % e))
+          continue
+        if not isinstance(row, dict):
+          yield _BadLine(line.rstrip("\r\n"), flaa_error(12, "The line is not a JSON object."))
+          continue
+        yield row
+  finally:
+    if f is not sys.stdin:
+      f.close()
+
+
+def import_table(cl: flaacl, table: str, path: str, fmt: Optional[str] = None, concurrency: int = 8,
+    queue_size: int = 64, checkpoint: Optional[str] = None, checkpoint_every: int = 1000,
+    errors_path: Optional[str] = None, progress: Optional[Callable[[int, float], None]] = None) -> Dict[str, Any]:
+  # Inserts the rows of path ('-' for stdin) into table on 'concurrency'
+  # threads. Rows are validated against the table structure first, and
+  # 'id' and '_version' are dropped. At most queue_size rows are waiting or
+  # in flight, so reading the file waits for the inserts. Rows that fail are
+  # counted and, with errors_path, written there as NDJSON with their error;
+  # so are lines of the file that cannot be read as a row.
+  # The checkpoint records how many rows of the file are done; rows before it
+  # are skipped when the import is run again.
+  from concurrent.futures import Future, ThreadPoolExecutor
+
+  fmt = fmt or guess_format(path)
+  if fmt not in FORMATS:
+    raise flaa_error(12, "The format '%s' is not one of %s." % (fmt, ", ".join(FORMATS)))
+  state = _load_checkpoint(checkpoint, table, fmt) if path != "-" else {}
+  skip = state.get("rows", 0)
+  report = {"rows": skip, "inserted": state.get("inserted", 0), "errors": state.get("errors", 0), "seconds": 0.0}
+
+  validator = cl._row_validator(table)
+  errors_out = open(errors_path, "a", encoding="utf-8") if errors_path else None
+  start = time.perf_counter()
+
+  def insert(row: Dict[str, Any]) -> int:
+    for field_name in GENERATED_FIELDS:
+      row.pop(field_name, None)
+    return cl._insert_validated(table, validator(row))
+
+  window = deque()
+
+  def collect() -> None:
+    number, row, future = window.popleft()
+    try:
+      future.result()
+      report["inserted"] += 1
+    except Exception as e:
+      report["errors"] += 1
+      if errors_out is not None:
+        if isinstance(e, flaa_error):
+          msg, code = e.msg, e.code
+        else:
+          msg, code = str(e) or e.__class__.__name__, None
+        errors_out.write(json.dumps({"row": number, "error": msg, "code": code, "data": row}) + "\n")
+    report["rows"] = number + 1
+    if report["rows"] % checkpoint_every == 0:
+      save()
+
+  def save() -> None:
+    if errors_out is not None:
+      errors_out.flush()
+    if path != "-":
+      _save_checkpoint(checkpoint, dict(report, table=table, format=fmt))
+    if progress is not None:
+      progress(report["rows"], time.perf_counter() - start)
+
+  try:
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+      for number, row in enumerate(_read_rows(path, fmt)):
+        if number < skip:
+          continue
+        if isinstance(row, _BadLine):
+          future = Future()
+          future.set_exception(row.error)
+          window.append((number, row.text, future))
+        else:
+          window.append((number, row, executor.submit(insert, dict(row))))
+        if len(window) >= queue_size:
+          collect()
+  finally:
+    # the executor has finished every insert by now, even when stopped by an
+    # error, so the checkpoint covers every row that was sent.
+    while window:
+      collect()
+    save()
+    if errors_out is not None:
+      errors_out.close()
+
+  report["seconds"] = time.perf_counter() - start
+  return report
@@ -0,0 +1,302 @@
+import threading
+from collections import deque
+from urllib.parse import quote, urlencode, urlsplit
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+class TransportError(Exception):
+  def __init__(self, msg: str):
+    super().__init__(msg)
+    self.msg = msg
+
+
+class Response:
+  def __init__(self, status_code: int, text: str, size: Optional[int] = None):
+    self.status_code = status_code
+    self.text = text
+    self.size = size  # the length of the body in bytes
+
+
+class StreamedResponse:
+  # A response whose body is read in chunks as it arrives.
+  def __init__(self, status_code: int, chunks: Iterator[bytes], close: Callable[[], None]):
+    self.status_code = status_code
+    self.chunks = chunks
+    self._close = close
+
+  @property
+  def text(self) -> str:
+    return b"".join(self.chunks).decode("utf-8", "replace")
+
+  def close(self) -> None:
+    self._close()
+
+
+class Transport:
+  # A transport sends the form posts of a flaacl. Responses must expose
+  # 'status_code' and 'text', and may expose 'size', the length of the body
+  # in bytes.
+  def post(self, url: str, data: Dict[str, str], timeout: Optional[float] = None):
+    raise NotImplementedError
+
+  def post_stream(self, url: str, data: Dict[str, str], timeout: Optional[float] = None,
+      chunk_size: int = 65536) -> StreamedResponse:
+    robj = self.post(url, data, timeout=timeout)
+    return StreamedResponse(robj.status_code, iter([robj.text.encode("utf-8")]), lambda: None)
+
+  def abort(self, thread_id: int) -> None:
+    # Makes the post running on thread thread_id fail with TransportError,
+    # if the transport can. Used when a hedged copy of a read wins.
+    pass
+
+  def close(self) -> None:
+    pass
+
+
+STREAM_DRAIN_BYTES = 65536
+
+
+class HTTPTransport(Transport):
+  # Posts over http.client with a pool of persistent connections per host.
+  # Only the standard library is used, and http.client and ssl are imported
+  # on the first request. Like RequestsTransport, threads wait for a free
+  # connection once 'pool_size' of them are busy.
+  def __init__(self, pool_size: int = 10, keep_alive: bool = True, verify: bool = False):
+    self.pool_size = pool_size
+    self.keep_alive = keep_alive
+    self.verify = verify
+    self._pools: Dict[Tuple[str, str, int], Tuple[threading.BoundedSemaphore, deque]] = {}
+    self._lock = threading.Lock()
+    self._ssl_context = None
+    self._posting: Dict[int, Any] = {}
+
+  def _pool(self, key: Tuple[str, str, int]) -> Tuple[threading.BoundedSemaphore, deque]:
+    pool = self._pools.get(key)
+    if pool is None:
+      with self._lock:
+        pool = self._pools.setdefault(key, (threading.BoundedSemaphore(self.pool_size), deque()))
+    return pool
+
+  def _connect(self, key: Tuple[str, str, int], timeout: Optional[float]):
+    import http.client
+
+    scheme, host, port = key
+    if scheme == "http":
+      return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    if self._ssl_context is None:
+      import ssl
+
+      context = ssl.create_default_context()
+      if not self.verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+      self._ssl_context = context
+    return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context)
+
+  def _checkout(self, key: Tuple[str, str, int], timeout: Optional[float]):
+    semaphore, idle = self._pool(key)
+    semaphore.acquire()
+    try:
+      while True:
+        try:
+          conn = idle.pop()
+        except IndexError:
+          return self._connect(key, timeout)
+        if conn.sock is not None and not _is_dropped(conn.sock):
+          conn.sock.settimeout(timeout)
+          return conn
+        conn.close()
+    except BaseException:
+      semaphore.release()
+      raise
+
+  def _checkin(self, key: Tuple[str, str, int], conn, reusable: bool) -> None:
+    semaphore, idle = self._pool(key)
+    if reusable and self.keep_alive:
+      idle.append(conn)
+    else:
+      conn.close()
+    semaphore.release()
+
+  def _send(self, url: str, data: Dict[str, str], timeout: Optional[float], thread_id: Optional[int] = None):
+    import http.client
+
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+    # names of projects and tables may hold any character, so the path is
+    # percent-encoded the way requests did it.
+    path = quote(parts.path or "/", safe="/")
+    if parts.query:
+      path += "?" + parts.query
+    body = urlencode(data).encode("utf-8")
+    headers = {"Content-Type": "application/x-www-form-urlencoded", "Accept-Encoding": "identity"}
+    if not self.keep_alive:
+      headers["Connection"] = "close"
+
+    conn = self._checkout(key, timeout)
+    if thread_id is not None:
+      with self._lock:
+        self._posting[thread_id] = conn
+    try:
+      conn.request("POST", path, body, headers)
+      return key, conn, conn.getresponse()
+    except BaseException as e:
+      if thread_id is not None:
+        with self._lock:
+          self._posting.pop(thread_id, None)
+      self._checkin(key, conn, False)
+      if isinstance(e, (OSError, http.client.HTTPException)):
+        raise TransportError(str(e) or e.__class__.__name__)
+      raise
+
+  def abort(self, thread_id: int) -> None:
+    import socket
+
+    with self._lock:
+      conn = self._posting.get(thread_id)
+      if conn is not None and conn.sock is not None:
+        try:
+          # socket.socket's own shutdown: an SSLSocket's would drop the TLS
+          # layer and leave the reader with the raw records.
+          socket.socket.shutdown(conn.sock, socket.SHUT_RDWR)
+        except OSError:
+          pass
+
+  def post(self, url: str, data: Dict[str, str], timeout: Optional[float] = None) -> Response:
+    import http.client
+
+    thread_id = threading.get_ident()
+    key, conn, resp = self._send(url, data, timeout, thread_id)
+    try:
+      body = resp.read()
+    except BaseException as e:
+      self._checkin(key, conn, False)
+      if isinstance(e, (OSError, http.client.HTTPException)):
+        raise TransportError(str(e) or e.__class__.__name__)
+      raise
+    finally:
+      with self._lock:
+        self._posting.pop(thread_id, None)
+    self._checkin(key, conn, not resp.will_close)
+    return Response(resp.status, body.decode(_charset(resp), "replace"), len(body))
+
+  def post_stream(self, url: str, data: Dict[str, str], timeout: Optional[float] = None,
+      chunk_size: int = 65536) -> StreamedResponse:
+    import http.client
+
+    key, conn, resp = self._send(url, data, timeout)
+    state = {"open": True}
+
+    def release() -> None:
+      if not state["open"]:
+        return
+      state["open"] = False
+      # a connection is only reused once its response was read to the end.
+      # Readers like iter_json_array stop at the end of the data, which can
+      # leave a few bytes (or the end of a chunked body) unread, so up to
+      # STREAM_DRAIN_BYTES are read and dropped first.
+      at_end = False
+      if not resp.will_close:
+        try:
+          left = STREAM_DRAIN_BYTES
+          while not resp.isclosed() and resp.length != 0 and left > 0:
+            chunk = resp.read1(min(left, 8192))
+            if not chunk:
+              break
+            left -= len(chunk)
+          at_end = resp.isclosed() or resp.length == 0
+        except Exception:
+          at_end = False
+      # http.client only sends on a connection once its response is closed.
+      resp.close()
+      self._checkin(key, conn, at_end)
+
+    def chunks() -> Iterator[bytes]:
+      try:
+        while True:
+          chunk = resp.read1(chunk_size)
+          if not chunk:
+            break
+          yield chunk
+      except (OSError, http.client.HTTPException) as e:
+        release()
+        raise TransportError(str(e) or e.__class__.__name__)
+      release()
+
+    return StreamedResponse(resp.status, chunks(), release)
+
+  def close(self) -> None:
+    with self._lock:
+      pools = list(self._pools.values())
+    for _, idle in pools:
+      while idle:
+        idle.pop().close()
+
+
+def _is_dropped(sock) -> bool:
+  # An idle keep-alive connection with something to read has been closed by
+  # the server (or is out of sync), so it must not be reused.
+  import select
+
+  try:
+    return bool(select.select([sock], [], [], 0)[0])
+  except (OSError, ValueError):
+    return True
+
+
+def _charset(resp) -> str:
+  content_type = resp.getheader("Content-Type", "")
+  for param in content_type.split(";")[1:]:
+    name, _, value = param.strip().partition("=")
+    if name.lower() == "charset" and value:
+      return value.strip('"')
+  return "utf-8"
+
+
+class RequestsTransport(Transport):
+  def __init__(self, pool_size: int = 10, keep_alive: bool = True, verify: bool = False):
+    self.pool_size = pool_size
+    self.keep_alive = keep_alive
+    self.verify = verify
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    # verify is off by default, so urllib3 would warn on every request.
+    requests.packages.urllib3.disable_warnings()
+    self._errors = requests.RequestException
+    self.session = requests.Session()
+    if not keep_alive:
+      self.session.headers["Connection"] = "close"
+
+    # pool_block makes threads wait for a free connection instead of opening
+    # throwaway ones once the pool is exhausted.
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    self.session.mount("https://", adapter)
+    self.session.mount("http://", adapter)
+
+  def post(self, url: str, data: Dict[str, str], timeout: Optional[float] = None):
+    try:
+      return self.session.post(url, data=data, timeout=timeout, verify=self.verify)
+    except self._errors as e:
+      raise TransportError(str(e))
+
+  def post_stream(self, url: str, data: Dict[str, str], timeout: Optional[float] = None,
+      chunk_size: int = 65536) -> StreamedResponse:
+    try:
+      robj = self.session.post(url, data=data, timeout=timeout, verify=self.verify, stream=True)
+    except self._errors as e:
+      raise TransportError(str(e))
+
+    def chunks() -> Iterator[bytes]:
+      try:
+        for chunk in robj.iter_content(chunk_size):
+          yield chunk
+      except self._errors as e:
+        raise TransportError(str(e))
+
+    return StreamedResponse(robj.status_code, chunks(), robj.close)
+
+  def close(self) -> None:
+    self.session.close()
@@ -0,0 +1,78 @@
+from . import objects
+from .errors import flaa_error
+from typing import Callable, Optional
+
+GENERATED_FIELDS = ("id", "_version")
+
+
+def compile_row_validator(table_obj: objects.Table) -> Callable[[dict], dict]:
+  # Works out everything the checks need from the table structure once and
+  # returns a function that validates a row and returns its form data.
+  field_names = frozenset(field_obj.field_name for field_obj in table_obj.fields)
+  string_fields = tuple(field_obj.field_name for field_obj in table_obj.fields if field_obj.field_type == "string")
+  int_fields = tuple(field_obj.field_name for field_obj in table_obj.fields if field_obj.field_type == "int")
+  required_fields = tuple(field_obj.field_name for field_obj in table_obj.fields if field_obj.required)
+
+  def validate(to_insert: dict) -> dict:
+    for key in to_insert:
+      if key not in field_names:
+        if key in GENERATED_FIELDS:
+          msg = "The field '%s' would be generated. Please remove." % (key)
+        else:
+          msg = "The field '%s' is not part of this table structure" % (key)
+        raise flaa_error(20, msg)
+
+    # a None value is a field that was not set, as urlencode would send it
+    # as the text 'None'.
+    data = {key: value for key, value in to_insert.items() if value is not None}
+    for field_name in required_fields:
+      if not field_name in data:
+        msg = "The field '%s' is required." % field_name
+        raise flaa_error(20, msg)
+
+    for field_name in string_fields:
+      v = data.get(field_name)
+      if v is None:
+        continue
+      v = str(v)
+      if len(v) > 200:
+        msg = "The value '%s' to field '%s' is longer than 200 characters" % (v, field_name)
+        raise flaa_error(24, msg)
+      if "\n" in v or "\r" in v:
+        msg = "The value of field '%s' contains new line." % field_name
+        raise flaa_error(24, msg)
+      data[field_name] = v
+
+    for field_name in int_fields:
+      v = data.get(field_name)
+      if v is None:
+        continue
+      text = _int_text(v)
+      if text is None:
+        msg = "The value '%s' to field '%s' is not of type 'int'" % (v, field_name)
+        raise flaa_error(24, msg)
+      data[field_name] = text
+
+    return data
+
+  return validate
+
+
+def _int_text(v) -> Optional[str]:
+  # The form value of v for an int field, or None when v is not a whole
+  # number. Only integers (anything with __index__), whole floats and
+  # strings of digits are taken, so 3.9 is not cut down to 3 and True is
+  # not sent as 1.
+  import operator
+
+  if isinstance(v, bool):
+    return None
+  if isinstance(v, str):
+    digits = v[1:] if v[:1] == "-" else v
+    return str(int(v)) if digits.isascii() and digits.isdigit() else None
+  if isinstance(v, float):
+    return str(int(v)) if v.is_integer() else None
+  try:
+    return str(operator.index(v))
+  except TypeError:
+    return None
@@ -0,0 +1,14 @@
+import sys
+
+import pytest
+
+import run
+
+
+@pytest.mark.skipif(not hasattr(sys, "stdlib_module_names"), reason="needs sys.stdlib_module_names (3.10+)")
+def test_import_pulls_in_no_third_party_modules():
+  # bench_import runs IMPORT_PROBE in a fresh interpreter, so nothing is
+  # imported already.
+  result = run.bench_import(1)
+  assert result["modules_loaded"] > 0
+  assert result["third_party_modules"] == []
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import pyflaarum
+from fake_server import FakeFlaarum
+
+STRUCTURE = """table: items
+fields:
+  name string required
+  price int
+  notes text
+::
+"""
+
+
+@pytest.fixture
+def server():
+  with FakeFlaarum() as server:
+    server.seed("first_proj", STRUCTURE, 0, None)
+    yield server
+
+
+@pytest.fixture
+def cl(server):
+  cl = pyflaarum.flaacl(server.host, "key", "first_proj", port=server.port)
+  yield cl
+  cl.close()
+
+
+def stored(server, row_id):
+  return server.tables[("first_proj", "items")].rows[row_id]
+
+
+def test_ids_come_back_in_input_order(server, cl):
+  rows = [{"name": "item-%d" % i, "price": i} for i in range(200)]
+  ids = cl.insert_rows("items", rows, concurrency=8)
+  assert len(ids) == len(rows)
+  assert len(set(ids)) == len(rows)
+  for row, row_id in zip(rows, ids):
+    assert stored(server, row_id)["name"] == row["name"]
+
+
+def test_bad_rows_get_an_error_in_their_place(server, cl):
+  rows = [
+    {"name": "good", "price": 1},
+    {"price": 2},
+    {"name": "bad price", "price": 3.9},
+    {"name": "bool price", "price": True},
+    {"name": "line\nbreak"},
+    {"name": None, "price": None},
+    {"name": "nones", "price": None, "notes": None},
+    {"name": "unknown", "colour": "red"},
+    {"name": "last", "price": "-7"},
+  ]
+  results = cl.insert_rows("items", rows, concurrency=4)
+  codes = [r.code if isinstance(r, pyflaarum.flaa_error) else None for r in results]
+  assert codes == [None, 20, 24, 24, 24, 20, None, 20, None]
+  assert stored(server, results[0])["price"] == "1"
+  # None values are fields that were not set, not the text 'None'.
+  assert stored(server, results[6]) == {"name": "nones", "id": results[6], "_version": 1}
+  assert stored(server, results[8])["price"] == "-7"
+  assert len(server.tables[("first_proj", "items")].rows) == 3
+
+
+def test_insert_rows_runs_concurrently(server, cl):
+  # with 10ms per reply, 8 workers get through 80 rows far sooner than the
+  # 0.8s one at a time would take.
+  server.latency = 0.01
+  rows = [{"name": "item-%d" % i} for i in range(80)]
+  start = time.perf_counter()
+  ids = cl.insert_rows("items", rows, concurrency=8)
+  elapsed = time.perf_counter() - start
+  assert not [i for i in ids if isinstance(i, Exception)]
+  assert len(rows) / elapsed > 200
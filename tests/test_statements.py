@@ -0,0 +1,128 @@
+import pytest
+
+import legacy_statements
+from pyflaarum import statements
+
+# The single-pass search statement parser must give the same Stmt objects as
+# the parser of pyflaarum 1.3.0, kept in benchmarks/legacy_statements.py.
+
+CORPUS = [
+  "table: users",
+  "table: users expand distinct\nfields: name age email\nlimit: 20\nstart_index: 40\norder_by: age desc",
+  """
+  table: users
+  fields: name age
+  where:
+    age > 20
+    and name != bob
+  """,
+  """
+  table: users
+  where:
+    id in 1 2 3 4 5 6 7 8 9 10
+  """,
+  """
+  table: users
+  order_by: id asc
+  where:
+    name = a
+    or name = b
+    or name = c
+  """,
+  """
+  table: users
+  limit: 100
+  joiner: or
+  where1:
+    age > 20
+    and age < 30
+  ::
+  where2:
+    name = bob
+  ::
+  """,
+  """
+  table: sales expand
+  fields: amount customer customer.name
+  start_index: 10
+  limit: 50
+  order_by: amount desc
+  joiner: and
+  where1:
+    amount > 100
+    and amount < 100000
+    and region = west
+  ::
+  where2:
+    customer.age > 18
+    or customer.vip = t
+  ::
+  where3:
+    status in paid shipped delivered returned
+  ::
+  where4:
+    created > 2020-01-01
+    and created < 2024-12-31
+  ::
+  """,
+]
+
+# special_split_line in 1.3.0 dropped quoted words, so quoted input is
+# checked against the expected words instead of the old parser.
+QUOTED = [
+  ("name = 'john doe'", ["name", "=", "john doe"]),
+  ("and title = 'a  b' ", ["and", "title", "=", "a  b"]),
+  ("city in lagos 'port harcourt' abuja", ["city", "in", "lagos", "port harcourt", "abuja"]),
+]
+
+BAD = [
+  "table:",
+  "bad",
+  "fields: name age",
+  "table: users\nlimit: ten",
+  "table: users\norder_by: id",
+  "table: users\njoiner: xor\nwhere1:\n a = b\n::\nwhere2:\n c = d\n::",
+  "table: users\njoiner: and\nwhere1:\n a = b\n::",
+  "table: users\nwhere:\n a = b\n and c = d\n or e = f",
+  "table: users\nwhere:\n name = 'john",
+]
+
+
+def dump(obj):
+  if isinstance(obj, (list, tuple)):
+    return [dump(item) for item in obj]
+  if hasattr(obj, "__dict__"):
+    return {key: dump(value) for key, value in vars(obj).items()}
+  if hasattr(obj, "_fields"):
+    return {key: dump(getattr(obj, key)) for key in obj._fields}
+  return obj
+
+
+@pytest.mark.parametrize("stmt", CORPUS)
+def test_same_as_legacy_parser(stmt):
+  assert dump(statements._parse_search_stmt(stmt)) == dump(legacy_statements.parse_search_stmt(stmt))
+
+
+@pytest.mark.parametrize("stmt", CORPUS)
+def test_cached_parse_is_frozen_and_equal(stmt):
+  stmt_obj = statements.parse_search_stmt(stmt)
+  assert stmt_obj is statements.parse_search_stmt(stmt)
+  assert dump(stmt_obj) == dump(legacy_statements.parse_search_stmt(stmt))
+  with pytest.raises(AttributeError):
+    stmt_obj.table = "other"
+
+
+@pytest.mark.parametrize("line, words", QUOTED)
+def test_special_split_line_keeps_quoted_words(line, words):
+  assert statements.special_split_line(line) == words
+
+
+@pytest.mark.parametrize("line", ["a = b", "status in paid shipped delivered", "  and  x  >  3  "])
+def test_special_split_line_same_as_legacy(line):
+  assert statements.special_split_line(line) == legacy_statements.special_split_line(line)
+
+
+@pytest.mark.parametrize("stmt", BAD)
+def test_bad_statements_raise(stmt):
+  with pytest.raises(ValueError):
+    statements.parse_search_stmt(stmt)